@@ -3,12 +3,20 @@
 """
 Common functionality for the whole LFSD package
 """
+import asyncio
 import json
 import platform
+import re
+import socket
+import struct
+from functools import cache
 from pathlib import Path
-from subprocess import check_output
 
+# ioctl request to get the address of a network interface (see netdevice(7))
+SIOCGIFADDR = 0x8915
 
+
+@cache
 def get_configuration_file_path() -> Path:
     """
     Get the path to the configuration file for the LFS simulation
@@ -23,6 +31,7 @@ def get_configuration_file_path() -> Path:
     return json_path
 
 
+@cache
 def get_lfs_path() -> Path:
     """
     Get the path where LFS is installed from the configuration file
@@ -37,6 +46,7 @@ def get_lfs_path() -> Path:
     return lfs_path
 
 
+@cache
 def get_lfs_cfg_txt_path() -> Path:
     "Returns the path to the LFS configuration file"
     path = get_lfs_path() / "cfg.txt"
@@ -61,6 +71,7 @@ def get_wsl2_host_ip_address() -> str:
     return ip_address
 
 
+@cache
 def is_wsl2() -> bool:
     "Indicates whether the current machine is a WSL2 machine"
 
@@ -68,15 +79,71 @@ def is_wsl2() -> bool:
     if platform.system() != "Linux":
         return False
 
-    return b"WSL2" in check_output(["uname", "-r"])
+    # same as `uname -r` without spawning a process
+    return b"WSL2" in Path("/proc/sys/kernel/osrelease").read_bytes()
+
+
+@cache
+def get_machine_ip_address(interface_name: str = "eth0") -> str:
+    """
+    Returns the IP address of the current machine. Only available on Linux.
+
+    Args:
+        interface_name: The name of the network interface to get the address of
+
+    Returns:
+        str: The IPv4 address of the interface
+    """
+    # fcntl is not available on Windows
+    import fcntl
 
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        ifreq = fcntl.ioctl(
+            sock.fileno(),
+            SIOCGIFADDR,
+            struct.pack("256s", interface_name.encode()[:15]),
+        )
 
-def get_machine_ip_address() -> str:
-    "Returns the IP address of the current machine"
-    return (
-        check_output(["ip", "-f", "inet", "addr", "show", "eth0"])
-        .decode("utf-8")
-        .split("inet")[1]
-        .split("/")[0]
-        .strip()
-    )
+    # the address is stored in the sockaddr_in struct that follows the interface name
+    return socket.inet_ntoa(ifreq[20:24])
+
+
+def _kernel_supports_io_uring() -> bool:
+    "Indicates whether the running Linux kernel is recent enough (>= 5.11) for io_uring"
+    match = re.match(r"(\d+)\.(\d+)", platform.release())
+    if match is None:
+        return False
+    return (int(match[1]), int(match[2])) >= (5, 11)
+
+
+def install_fast_event_loop_policy() -> None:
+    """
+    Install the fastest available event loop policy. On Linux kernels with io_uring
+    support uringcore is preferred, then uvloop. On Windows winloop is used. If none
+    of them is installed the default asyncio event loop is kept.
+    """
+    if platform.system() == "Windows":
+        try:
+            import winloop
+        except ImportError:
+            print('You can improve performance by installing "winloop"')
+        else:
+            winloop.install()
+        return
+
+    if platform.system() == "Linux" and _kernel_supports_io_uring():
+        # prefer an io_uring backed event loop
+        try:
+            import uringcore
+        except ImportError:
+            pass
+        else:
+            asyncio.set_event_loop_policy(uringcore.EventLoopPolicy())
+            return
+
+    try:
+        import uvloop
+    except ImportError:
+        print('You can improve performance by installing "uvloop"')
+    else:
+        uvloop.install()
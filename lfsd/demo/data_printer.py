@@ -12,19 +12,12 @@ from lfsd import ConeTypes, LFSInterface
 
 class PrinterLFSInterface(LFSInterface):
     async def on_lfs_data(self, data):
-        yellow_cones = [
-            cone
-            for cone in data.processed_outsim_data.visible_cones
-            if cone.cone_type == ConeTypes.YELLOW
-        ]
-        blue_cones = [
-            cone
-            for cone in data.processed_outsim_data.visible_cones
-            if cone.cone_type == ConeTypes.BLUE
-        ]
-
-        print(f"No of yellow cones: {len(yellow_cones)}")
-        print(f"No of blue cones: {len(blue_cones)}")
+        cone_counts = np.bincount(
+            data.processed_outsim_data.visible_cones_types, minlength=len(ConeTypes)
+        )
+
+        print(f"No of yellow cones: {cone_counts[ConeTypes.YELLOW]}")
+        print(f"No of blue cones: {cone_counts[ConeTypes.BLUE]}")
 
         steering = np.sin(time() * np.pi * 2 / 2)
         throttle = 0.5
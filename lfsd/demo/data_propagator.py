@@ -1,26 +1,93 @@
 import asyncio
-import json
-import sys
-from dataclasses import asdict
-from typing import Any, Coroutine, cast
+import socket
+from dataclasses import fields, is_dataclass
+from typing import Any, Coroutine, Iterator, cast
 
 import asyncio_dgram
-import numpy as np
+import orjson
 import typer
 
 from lfsd import LFSData, LFSInterface
 from lfsd.lyt_interface.detection_model import DetectionModel
+from lfsd.outsim_interface.functional import ProcessedOutsimData
 
 
-class NumpyEncoder(json.JSONEncoder):
+# orjson serializes enums and numpy arrays natively, dataclasses are passed to
+# `serialize_dataclass` so that the LFSData object can be encoded without an
+# intermediate `asdict` copy while keeping the `visible_cones` key of the payload
+SERIALIZATION_OPTIONS = (
+    orjson.OPT_SERIALIZE_NUMPY
+    | orjson.OPT_APPEND_NEWLINE
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+)
+
+# newline separated frames are coalesced into datagrams of at most this many bytes
+MAX_DATAGRAM_SIZE = 8192
+# the number of frames that can be queued before the oldest ones are dropped
+SEND_QUEUE_SIZE = 100
+# the maximum number of bytes read from a single driving command datagram
+RECV_SIZE = 65536
+# sent as the `visible_cones` list instead of as arrays
+_CONE_ARRAY_FIELDS = frozenset(("visible_cones_positions", "visible_cones_types"))
+
+
+def serialize_dataclass(obj: Any) -> dict[str, Any]:
     """
-    Custom JSON encoder that converts NumPy arrays to lists
+    The `default` hook for orjson. Encodes dataclasses by their fields.
+    `ProcessedOutsimData` stores the visible cones as arrays, they are sent only as
+    the list of cone objects under `visible_cones` so that the payload keeps the
+    format that receivers expect.
+
+    Args:
+        obj: The object that orjson cannot serialize natively
+
+    Returns:
+        The fields of the dataclass as a dictionary
     """
+    if not is_dataclass(obj):
+        raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+    if not isinstance(obj, ProcessedOutsimData):
+        return {field.name: getattr(obj, field.name) for field in fields(obj)}
+
+    serializable: dict[str, Any] = {
+        "visible_cones": [
+            {"x": x, "y": y, "cone_type": cone_type}
+            for (x, y), cone_type in zip(
+                obj.visible_cones_positions.tolist(), obj.visible_cones_types.tolist()
+            )
+        ]
+    }
+    for field in fields(obj):
+        if field.name not in _CONE_ARRAY_FIELDS:
+            serializable[field.name] = getattr(obj, field.name)
 
-    def default(self, obj: Any) -> Any:
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        return super().default(obj)
+    return serializable
+
+
+def batch_payloads(payloads: list[bytes], max_size: int) -> Iterator[bytes]:
+    """
+    Join consecutive payloads into batches of at most `max_size` bytes. A payload
+    that is larger than `max_size` on its own is yielded as a single batch.
+
+    Args:
+        payloads: The payloads to batch, each one ending with a newline
+        max_size: The maximum size of a batch in bytes
+
+    Yields:
+        The batched payloads
+    """
+    batch: list[bytes] = []
+    batch_size = 0
+    for payload in payloads:
+        if batch and batch_size + len(payload) > max_size:
+            yield b"".join(batch)
+            batch, batch_size = [], 0
+        batch.append(payload)
+        batch_size += len(payload)
+
+    if batch:
+        yield b"".join(batch)
 
 
 class PropagatorLFSInterface(LFSInterface):
@@ -40,7 +107,9 @@ class PropagatorLFSInterface(LFSInterface):
             detection_model,
         )
 
-        self._data_to_send_outside: LFSData | None = None
+        self._data_to_send_outside: asyncio.Queue[LFSData] = asyncio.Queue(
+            maxsize=SEND_QUEUE_SIZE
+        )
 
         self._send_host: str | None = None
         self._send_port: int | None = None
@@ -48,10 +117,13 @@ class PropagatorLFSInterface(LFSInterface):
         self._recv_port: int | None = None
 
         self._send_sock: asyncio_dgram.DatagramClient | None = None
-        self._recv_sock: asyncio_dgram.DatagramServer | None = None
+        self._recv_sock: socket.socket | None = None
 
     async def on_lfs_data(self, data):
-        self._data_to_send_outside = data
+        if self._data_to_send_outside.full():
+            # the sender cannot keep up, drop the oldest frame
+            self._data_to_send_outside.get_nowait()
+        self._data_to_send_outside.put_nowait(data)
 
     def additional_spinners(self) -> list[Coroutine[Any, Any, Any]]:
         return_value = super().additional_spinners() + [
@@ -66,18 +138,25 @@ class PropagatorLFSInterface(LFSInterface):
             (self._send_host, self._send_port)
         )
         while True:
-            await asyncio.sleep(0.001)
-            if self._data_to_send_outside is not None:
-                send_dict = asdict(self._data_to_send_outside)
-                send_json = json.dumps(send_dict, cls=NumpyEncoder).encode() + b"\n"
+            # wait for the next frame, then take everything else that queued up
+            # in the meantime so that it can be sent with as few syscalls as possible
+            frames = [await self._data_to_send_outside.get()]
+            while not self._data_to_send_outside.empty():
+                frames.append(self._data_to_send_outside.get_nowait())
+
+            payloads = [
+                orjson.dumps(
+                    frame, default=serialize_dataclass, option=SERIALIZATION_OPTIONS
+                )
+                for frame in frames
+            ]
 
+            for datagram in batch_payloads(payloads, MAX_DATAGRAM_SIZE):
                 try:
-                    await self._send_sock.send(send_json)
+                    await self._send_sock.send(datagram)
                 except ConnectionRefusedError:
                     pass
 
-                self._data_to_send_outside = None
-
     async def wait_for_hosts_and_ports_to_be_set(self) -> None:
         while (
             self._send_host is None
@@ -88,64 +167,77 @@ class PropagatorLFSInterface(LFSInterface):
             await asyncio.sleep(1.0)
 
     def parse_driving_command_buffer(
-        self, buffer: bytes
-    ) -> tuple[bytes, list[tuple[float, float, float, float, int]]]:
+        self, buffer: bytearray
+    ) -> tuple[float, float, float, float, int] | None:
+        """
+        Parse the latest complete driving command in the buffer. Older commands are
+        obsolete, so they are skipped without being decoded. All complete commands
+        are removed from the buffer in place, only the incomplete tail is kept.
+
+        Args:
+            buffer: The received bytes that have not been parsed yet
+
+        Returns:
+            The latest driving command (None if the buffer does not contain a complete
+            command)
+        """
         # each command is a json list of 3 or 5 floats
         # each command is separated by a \n byte
-        commands = []
-        while b"\n" in buffer:
-            command, buffer = buffer.split(b"\n", 1)
+        last_newline = end = buffer.rfind(b"\n")
+        command = None
+        while end >= 0:
+            start = buffer.rfind(b"\n", 0, end) + 1
             try:
-                command = json.loads(command.decode())
-            except json.JSONDecodeError:
+                values = orjson.loads(buffer[start:end])
+            except orjson.JSONDecodeError:
                 # it is possible that the very first command
-                # is not a complete command, so we ignore it
-                pass
+                # is not a complete command, so we try the one before it
+                end = start - 1
+                continue
+
+            if len(values) == 3:
+                steering, throttle, brake = cast(tuple[float, float, float], values)
+                clutch = 0.0
+                gear = 0
+            elif len(values) == 5:
+                steering, throttle, brake, clutch, gear = cast(
+                    tuple[float, float, float, float, int], values
+                )
             else:
-                if len(command) == 3:
-                    steering, throttle, brake = cast(
-                        tuple[float, float, float], command
-                    )
-                    clutch = 0.0
-                    gear = 0
-                elif len(command) == 5:
-                    steering, throttle, brake, clutch, gear = cast(
-                        tuple[float, float, float, float, int], command
-                    )
-                else:
-                    raise ValueError(
-                        f"Expected 3 or 5 driving outputs, got {len(command)}"
-                    )
-
-                commands.append((steering, throttle, brake, clutch, gear))
-
-        return buffer, commands
+                raise ValueError(f"Expected 3 or 5 driving outputs, got {len(values)}")
+
+            command = (steering, throttle, brake, clutch, gear)
+            break
+
+        del buffer[: last_newline + 1]
+        return command
 
     async def spin_recv_driving_command(self) -> None:
         await self.wait_for_hosts_and_ports_to_be_set()
-        # create socket
-        self._recv_sock = await asyncio_dgram.bind((self._recv_host, self._recv_port))
+        # create a non-blocking socket, so that queued datagrams can be drained
+        self._recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._recv_sock.setblocking(False)
+        self._recv_sock.bind((self._recv_host, self._recv_port))
 
-        buffer = b""
+        loop = asyncio.get_running_loop()
+
+        # received bytes are appended in place, parsed commands are removed in place
+        buffer = bytearray()
         while True:
-            # receive data with timeout of 5ms
-            try:
-                data, addr = await asyncio.wait_for(
-                    self._recv_sock.recv(), timeout=0.005
-                )
-            except asyncio.TimeoutError:
-                continue
-            else:
-                buffer += data
-                # parse buffer
-                buffer, commands = self.parse_driving_command_buffer(buffer)
-
-                # send the last command
-                if len(commands) > 0:
-                    steering, throttle, brake, clutch, gear = commands[-1]
-                    await self.send_driving_command(
-                        steering, throttle, brake, clutch, gear
-                    )
+            buffer.extend(await loop.sock_recv(self._recv_sock, RECV_SIZE))
+
+            # drain everything that queued up in the meantime, only the latest
+            # command is sent to LFS
+            while True:
+                try:
+                    buffer.extend(self._recv_sock.recv(RECV_SIZE))
+                except BlockingIOError:
+                    break
+
+            command = self.parse_driving_command_buffer(buffer)
+            if command is not None:
+                steering, throttle, brake, clutch, gear = command
+                await self.send_driving_command(steering, throttle, brake, clutch, gear)
 
 
 def main(send_host: str, send_port: int, recv_host: str, recv_port: int) -> None:
@@ -3,9 +3,12 @@
 """
 This is a demo of the LFSInterface. It prints the number of visible cones and sends a steering command to LFS.
 """
+import asyncio
 import pickle
+import struct
 from pathlib import Path
 from time import time
+from typing import Any, BinaryIO, Coroutine, Iterator
 
 import typer
 
@@ -13,6 +16,89 @@ from lfsd import LFSInterface
 from lfsd.lyt_interface.detection_model import DetectionModel
 from lfsd.outsim_interface import LFSData
 
+# every chunk in a data file is prefixed with its length
+CHUNK_LENGTH_STRUCT = struct.Struct("<Q")
+
+
+def _write_chunk(file: BinaryIO, chunk: bytes | memoryview) -> None:
+    file.write(CHUNK_LENGTH_STRUCT.pack(len(chunk)))
+    file.write(chunk)
+
+
+def _read_chunk(file: BinaryIO) -> bytearray:
+    (length,) = CHUNK_LENGTH_STRUCT.unpack(file.read(CHUNK_LENGTH_STRUCT.size))
+    # read into a bytearray so that arrays rebuilt from it are writable
+    chunk = bytearray(length)
+    file.readinto(chunk)
+    return chunk
+
+
+def dump_with_out_of_band_buffers(obj: Any, file: BinaryIO) -> None:
+    """
+    Pickle an object with protocol 5, writing the buffers of numpy arrays out of band
+    so that they are written to the file directly instead of being copied into the
+    pickle stream.
+
+    The object is written as the number of out of band buffers, followed by the pickle
+    stream and the buffers, each one prefixed with its length.
+
+    Args:
+        obj: The object to pickle
+        file: The file to write to
+    """
+    buffers: list[pickle.PickleBuffer] = []
+    pickle_stream = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+
+    file.write(CHUNK_LENGTH_STRUCT.pack(len(buffers)))
+    _write_chunk(file, pickle_stream)
+    for buffer in buffers:
+        _write_chunk(file, buffer.raw())
+
+
+def load_with_out_of_band_buffers(file: BinaryIO) -> Any:
+    """
+    Load an object written with `dump_with_out_of_band_buffers`
+
+    Args:
+        file: The file to read from
+
+    Returns:
+        The unpickled object
+    """
+    (n_buffers,) = CHUNK_LENGTH_STRUCT.unpack(file.read(CHUNK_LENGTH_STRUCT.size))
+    pickle_stream = _read_chunk(file)
+    buffers = [_read_chunk(file) for _ in range(n_buffers)]
+    return pickle.loads(pickle_stream, buffers=buffers)
+
+
+def iterate_combined_data_file(path: Path) -> Iterator[LFSData]:
+    """
+    Iterate over the records of a file written by
+    `SaverLFSInterface.combine_data_files` without loading the whole file in memory
+
+    Args:
+        path: The path to the combined data file
+
+    Yields:
+        The recorded LFS data, one at a time
+    """
+    with open(path, "rb") as f:
+        while f.peek(1):
+            yield load_with_out_of_band_buffers(f)
+
+
+def write_data_file(filepath: Path, data_list: list[LFSData]) -> None:
+    """
+    Write a list of LFS data to a new file, creating its directory if needed
+
+    Args:
+        filepath: The path of the file to write
+        data_list: The data to write
+    """
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(filepath, "wb") as f:
+        dump_with_out_of_band_buffers(data_list, f)
+
 
 class SaverLFSInterface(LFSInterface):
     def __init__(
@@ -31,11 +117,21 @@ class SaverLFSInterface(LFSInterface):
             detection_model,
         )
 
-        self._data_dir: str | None
-        self._buffer_size: int | None
-        self._flush_interval: float | None
-        self._data_buffer = []
+        self._data_dir: str | None = None
+        # flush after this many samples or this many seconds, whichever comes first
+        self._buffer_size = 100
+        self._flush_interval = 2.0
+        self._data_buffer: list[LFSData] = []
         self._last_flush_time = time()
+        # the index in the name of the last data file, the names are never reused
+        self._last_file_index = 0
+
+        # at most two files are written in the background at the same time
+        self._write_semaphore = asyncio.Semaphore(2)
+        self._write_tasks: set[asyncio.Task[None]] = set()
+        # the data of the files that no worker thread has started writing yet, they
+        # are written synchronously on shutdown so that no frames are lost
+        self._pending_writes: dict[Path, list[LFSData]] = {}
 
     async def on_lfs_data(self, data: LFSData) -> None:
         # add data to buffer
@@ -47,43 +143,107 @@ class SaverLFSInterface(LFSInterface):
         ):
             self.flush_data()
 
-    def flush_data(self):
-        # create data directory if it doesn't exist
-        data_path = Path(self._data_dir)
-
-        data_path.mkdir(parents=True, exist_ok=True)
-
-        # generate filename based on current time
-        filename = f"{int(time() * 10)}.pkl"
-        filepath = data_path / filename
-
+    def flush_data(self) -> None:
+        """
+        Write the buffered data to a new file. The pickling and writing happen in a
+        worker thread so that the event loop is not blocked. If no event loop is
+        running the file is written synchronously.
+        """
         # early exit if buffer is empty
         if len(self._data_buffer) == 0:
             return
 
-        # save data to file
-        with open(filepath, "wb") as f:
-            pickle.dump(self._data_buffer, f)
+        if self._data_dir is None:
+            raise ValueError("The directory to save the data in has not been set")
 
-        # clear buffer and update last flush time
-        self._data_buffer.clear()
+        filepath = self._next_data_filepath()
+
+        # swap the buffer, the old one now belongs to the writer
+        data_to_write, self._data_buffer = self._data_buffer, []
         self._last_flush_time = time()
 
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            write_data_file(filepath, data_to_write)
+            return
+
+        self._pending_writes[filepath] = data_to_write
+        task = loop.create_task(self._write_data_file(filepath))
+        # keep a reference to the task so that it is not garbage collected
+        self._write_tasks.add(task)
+        task.add_done_callback(self._write_tasks.discard)
+
+    def _next_data_filepath(self) -> Path:
+        """
+        Generate the path of a new data file, named after the current time in tenths
+        of a second. Files flushed within the same tenth of a second get the next
+        free index, so no file is written twice.
+        """
+        assert self._data_dir is not None
+        file_index = max(int(time() * 10), self._last_file_index + 1)
+        # skip the files left over from a previous run
+        while (Path(self._data_dir) / f"{file_index}.pkl").exists():
+            file_index += 1
+
+        self._last_file_index = file_index
+        return Path(self._data_dir) / f"{file_index}.pkl"
+
+    async def _write_data_file(self, filepath: Path) -> None:
+        async with self._write_semaphore:
+            # the data is already written if the interface shut down in the meantime
+            data_list = self._pending_writes.pop(filepath, None)
+            if data_list is None:
+                return
+            # once started, the thread finishes writing even if this task is
+            # cancelled, `asyncio.run` waits for it before returning
+            await asyncio.to_thread(write_data_file, filepath, data_list)
+
+    def write_pending_data(self) -> None:
+        """
+        Synchronously write the buffered data and the data of all the files that are
+        still waiting for a worker thread
+        """
+        if len(self._data_buffer) > 0 and self._data_dir is not None:
+            filepath = self._next_data_filepath()
+            data_to_write, self._data_buffer = self._data_buffer, []
+            self._pending_writes[filepath] = data_to_write
+
+        while self._pending_writes:
+            filepath, data_list = self._pending_writes.popitem()
+            write_data_file(filepath, data_list)
+
+    def additional_spinners(self) -> list[Coroutine[Any, Any, Any]]:
+        return super().additional_spinners() + [self.spin_write_pending_on_exit()]
+
+    async def spin_write_pending_on_exit(self) -> None:
+        """
+        Wait until the interface shuts down (e.g. on Ctrl-C), then write the data
+        that has not been written yet
+        """
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self.write_pending_data()
+
     def combine_data_files(self):
         # get list of data files
         data_path = Path(self._data_dir)
-        data_files = sorted(data_path.glob("*.pkl"))
+        combined_filepath = data_path / "combined.pkl"
+        data_files = sorted(
+            path for path in data_path.glob("*.pkl") if path != combined_filepath
+        )
 
-        # combine data from all files
-        data_list = []
-        for data_file in data_files:
-            with open(data_file, "rb") as f:
-                data_list.extend(pickle.load(f))
+        # stream the data of one file at a time into the combined file, every
+        # LFSData object is written as its own record. the records are independent,
+        # so they are appended after the ones of a previous run, which are kept
+        with open(combined_filepath, "ab") as combined_file:
+            for data_file in data_files:
+                with open(data_file, "rb") as f:
+                    data_list = load_with_out_of_band_buffers(f)
 
-        # save combined data to file
-        combined_filepath = data_path / "combined.pkl"
-        with open(combined_filepath, "wb") as f:
-            pickle.dump(data_list, f)
+                for data in data_list:
+                    dump_with_out_of_band_buffers(data, combined_file)
 
         # delete individual data files
         for data_file in data_files:
@@ -93,8 +253,6 @@ class SaverLFSInterface(LFSInterface):
 def main(dir_to_save: str) -> None:
     interface = SaverLFSInterface()
     interface._data_dir = dir_to_save
-    interface._buffer_size = 100
-    interface._flush_interval = 2.0
     try:
         interface.spin()
     except KeyboardInterrupt:
@@ -5,31 +5,124 @@ This is a demo of the LFSInterface. It prints the number of visible cones and se
 """
 
 
+import logging
 import pickle
+from functools import lru_cache
 from itertools import count
 from pathlib import Path
+from time import perf_counter
 
 import numpy as np
-from sklearn.neighbors import KernelDensity
 
 from lfsd import ConeTypes, LFSData, LFSInterface
 
-
-def convert_cones_to_heatmap(cones: np.ndarray, range: int, resolution: int):
-    # create a grid of points to evaluate the kde model
-    r = np.linspace(-range, range, resolution)
-
-    xx, yy = np.meshgrid(r, r)
-
-    return_value = np.zeros_like(xx)
+try:
+    import numba
+    from numba import prange
+except ImportError:  # numba is optional, the numpy implementation is used instead
+    numba = None
+    prange = range
+
+_log = logging.getLogger(__name__)
+
+# maps the predicted steering angle (rad) to the [-1, 1] steering command
+INVERSE_STEERING_SCALE = -1 / 0.52358
+
+
+def _gaussian_kernel_density_loop(
+    cones_x: np.ndarray, cones_y: np.ndarray, grid_axis: np.ndarray, bandwidth: float
+) -> np.ndarray:
+    """
+    Evaluates a 2d gaussian kernel density estimate of the provided cones on the
+    square grid spanned by `grid_axis`. The result is normalized the same way as
+    `sklearn.neighbors.KernelDensity(kernel="gaussian")`.
+
+    Args:
+        cones_x: The x coordinates of the cones
+        cones_y: The y coordinates of the cones
+        grid_axis: The coordinates of the grid along each axis
+        bandwidth: The bandwidth of the gaussian kernel
+
+    Returns:
+        The density at each grid point, rows follow y and columns follow x
+    """
+    resolution = grid_axis.shape[0]
+    n_cones = cones_x.shape[0]
+    density = np.zeros((resolution, resolution))
+    if n_cones == 0:
+        return density
+
+    normalization = 1.0 / (n_cones * 2.0 * np.pi * bandwidth * bandwidth)
+    inverse_two_bandwidth_sq = 1.0 / (2.0 * bandwidth * bandwidth)
+
+    for row in prange(resolution):
+        grid_y = grid_axis[row]
+        for col in range(resolution):
+            grid_x = grid_axis[col]
+            total = 0.0
+            for i in range(n_cones):
+                dx = grid_x - cones_x[i]
+                dy = grid_y - cones_y[i]
+                total += np.exp(-(dx * dx + dy * dy) * inverse_two_bandwidth_sq)
+            density[row, col] = total * normalization
+
+    return density
+
+
+def _gaussian_kernel_density_numpy(
+    cones_x: np.ndarray, cones_y: np.ndarray, grid_axis: np.ndarray, bandwidth: float
+) -> np.ndarray:
+    """
+    NumPy implementation of `gaussian_kernel_density`, used when numba is not
+    available
+    """
+    n_cones = cones_x.shape[0]
+    if n_cones == 0:
+        return np.zeros((grid_axis.shape[0], grid_axis.shape[0]))
+
+    # the squared distances are separable, so they are computed per axis and only
+    # broadcast to (resolution, resolution, n_cones) once
+    dx_sq = np.square(grid_axis[:, None] - cones_x)
+    dy_sq = np.square(grid_axis[:, None] - cones_y)
+    dist_sq = dy_sq[:, None, :] + dx_sq[None, :, :]
+
+    density = np.exp(dist_sq * (-1.0 / (2.0 * bandwidth * bandwidth))).sum(axis=-1)
+    density *= 1.0 / (n_cones * 2.0 * np.pi * bandwidth * bandwidth)
+    return density
+
+
+if numba is not None:
+    gaussian_kernel_density = numba.njit(parallel=True, fastmath=True, cache=True)(
+        _gaussian_kernel_density_loop
+    )
+else:
+    gaussian_kernel_density = _gaussian_kernel_density_numpy
+
+
+@lru_cache(maxsize=8)
+def heatmap_grid_axis(range: int, resolution: int) -> np.ndarray:
+    "The coordinates along each axis of the grid on which the kde is evaluated"
+    grid_axis = np.linspace(-range, range, resolution)
+    # the array is shared between calls, so it must not be modified
+    grid_axis.flags.writeable = False
+    return grid_axis
+
+
+def convert_cones_to_heatmap(
+    cones_positions: np.ndarray, cones_types: np.ndarray, range: int, resolution: int
+):
+    r = heatmap_grid_axis(range, resolution)
+
+    return_value = np.zeros((resolution, resolution))
 
     for cone_type in [ConeTypes.BLUE, ConeTypes.YELLOW]:
-        kde = KernelDensity(bandwidth=0.6)
-        kde.fit(cones[cones[:, 2] == cone_type][:, :2])
-
-        # evaluate the kde model on the grid
-        zz = np.exp(kde.score_samples(np.c_[xx.ravel(), yy.ravel()]))
-        zz = zz.reshape(xx.shape)
+        cones_of_type = cones_positions[cones_types == cone_type]
+        zz = gaussian_kernel_density(
+            np.ascontiguousarray(cones_of_type[:, 0]),
+            np.ascontiguousarray(cones_of_type[:, 1]),
+            r,
+            0.6,
+        )
 
         zz[zz < 0.001] = 0
 
@@ -44,17 +137,12 @@ def convert_list_of_lfs_data_to_dataset(dataraw: list[LFSData]):
     dataset = []
 
     for d in dataraw[::]:
-        cones = d.processed_outsim_data.visible_cones
-
-        cones_array = np.array(
-            [
-                (c.x, c.y, c.cone_type)
-                for c in cones
-                if c.cone_type in [ConeTypes.BLUE, ConeTypes.YELLOW]
-            ]
+        heatmap = convert_cones_to_heatmap(
+            d.processed_outsim_data.visible_cones_positions,
+            d.processed_outsim_data.visible_cones_types,
+            20,
+            40,
         )
-
-        heatmap = convert_cones_to_heatmap(cones_array, 20, 40)
         heatmap_flat = heatmap.flatten()
 
         # get car inputs
@@ -82,29 +170,31 @@ class MLPLFSInterface(LFSInterface):
         heatmap = self.normalizer([heatmap])
 
         # predict driving inputs
-        from time import time
+        tic = perf_counter()
+        steering, throttle, brake = self.model.predict(heatmap)[0].round(3).tolist()
 
-        tic = time()
-        steering, throttle, brake = self.model.predict(heatmap)[0].round(3)
+        linear_velocity_local = data.processed_outsim_data.linear_velocity_local
+        longitudinal_velocity = linear_velocity_local[0].item()
 
         # overwrite throttle and brake if velocity is low
-        if data.processed_outsim_data.linear_velocity_local[0] < 2.0:
+        if longitudinal_velocity < 2.0:
             throttle = 0.3
             brake = 0.0
 
         # overwrite throttle if velocity is high
-        if data.processed_outsim_data.linear_velocity_local[0] > 10.0:
+        if longitudinal_velocity > 10.0:
             throttle = 0.0
 
-        steering /= -0.52358
+        steering *= INVERSE_STEERING_SCALE
 
-        steering = np.clip(steering, -1, 1)
-        throttle = np.clip(throttle, 0, 1)
-        brake = np.clip(brake, 0, 1)
+        # clip with plain float math, np.clip is much slower for scalars
+        steering = -1.0 if steering < -1.0 else 1.0 if steering > 1.0 else steering
+        throttle = 0.0 if throttle < 0.0 else 1.0 if throttle > 1.0 else throttle
+        brake = 0.0 if brake < 0.0 else 1.0 if brake > 1.0 else brake
 
-        toc = time()
-        print("prediction took", toc - tic, "seconds")
-        print(steering, throttle, brake)
+        if _log.isEnabledFor(logging.DEBUG):
+            _log.debug("prediction took %s seconds", perf_counter() - tic)
+            _log.debug("driving command: %s %s %s", steering, throttle, brake)
         await self.send_driving_command(steering, throttle, brake)
 
 
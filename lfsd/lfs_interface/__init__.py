@@ -4,19 +4,27 @@
 The main interface to LFS
 """
 import asyncio
+import os
 import platform
 import subprocess
 from abc import ABC, abstractmethod
+from functools import partialmethod
 from pathlib import Path
-from typing import Any, Coroutine
+from typing import Any, Coroutine, TypeVar
 
-from lfsd.common import get_wsl2_host_ip_address, is_wsl2
+from lfsd.common import (
+    get_wsl2_host_ip_address,
+    install_fast_event_loop_policy,
+    is_wsl2,
+)
 from lfsd.lyt_interface.detection_model import (
     BasicConicalDetectionModel,
     DetectionModel,
 )
 from lfsd.outsim_interface import LFSData, OutsimInterface
 
+T = TypeVar("T", bound="LFSInterface")
+
 
 class LFSInterface(ABC):
     def __init__(
@@ -90,13 +98,48 @@ class LFSInterface(ABC):
             steering, throttle, brake, clutch, gear_delta
         )
 
-    def __get_lfs_computer_ip_if_possible(self) -> str:
+    @classmethod
+    def with_defaults(cls: type[T], **default_kwargs: Any) -> type[T]:
+        """
+        Create a subclass whose constructor uses the given keyword arguments as
+        defaults. The LFS computer IP and installation path are resolved once here
+        if they are not given, so they are not looked up again for every instance.
+
+        Args:
+            **default_kwargs: The keyword arguments to pass to the constructor. They
+            can still be overridden by passing them as keyword arguments when
+            creating an instance.
+
+        Returns:
+            The subclass with the defaults applied.
+        """
+        if default_kwargs.get("lfs_computer_ip") is None:
+            default_kwargs["lfs_computer_ip"] = cls.__get_lfs_computer_ip_if_possible()
+
+        if default_kwargs.get("lfs_installation_path") is None:
+            default_kwargs[
+                "lfs_installation_path"
+            ] = cls.__get_default_lfs_installation_path()
+
+        return type(
+            cls.__name__,
+            (cls,),
+            {
+                "__init__": partialmethod(cls.__init__, **default_kwargs),
+                "__qualname__": cls.__qualname__,
+                "__module__": cls.__module__,
+            },
+        )
+
+    @staticmethod
+    def __get_lfs_computer_ip_if_possible() -> str:
         if is_wsl2():
             return get_wsl2_host_ip_address()
 
         return "127.0.0.1"
 
-    def __get_default_lfs_installation_path(self) -> str:
+    @staticmethod
+    def __get_default_lfs_installation_path() -> str:
         # if windows
         if platform.system() == "Windows":
             return "C:\LFS"
@@ -109,20 +152,31 @@ class LFSInterface(ABC):
 
     def __start_running_windows_script_in_background(self) -> None:
         """
-        Starts the script that runs LFS in the background
+        Starts the script that runs LFS in the background. If the script is still
+        running from a previous call it is reused.
         """
+        if self.__windows_process is not None and self.__windows_process.poll() is None:
+            return
+
         script_path = Path(__file__).absolute().parent.parent / "lfs_windows_output.py"
-        self.__windows_process = subprocess.Popen(
-            [
-                "powershell.exe",
-                "python",
-                str(script_path),
-                str(self.__outsim_interface.vjoy_port),
-            ],
-            # write output to file
-            stdout=open("lfs_windows_output.log", "w"),
-            stderr=subprocess.STDOUT,
+        # write output to file, the child gets its own copy of the descriptor so
+        # ours can be closed right away
+        log_fd = os.open(
+            "lfs_windows_output.log", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644
         )
+        try:
+            self.__windows_process = subprocess.Popen(
+                [
+                    "powershell.exe",
+                    "python",
+                    str(script_path),
+                    str(self.__outsim_interface.vjoy_port),
+                ],
+                stdout=log_fd,
+                stderr=subprocess.STDOUT,
+            )
+        finally:
+            os.close(log_fd)
 
     async def __loop_outsim(self) -> None:
         async with self.__outsim_interface:
@@ -136,19 +190,22 @@ class LFSInterface(ABC):
         # by default, no additional spinners, subclasses can override this
         return []
 
+    async def __spin_async(self) -> None:
+        extra_spinners = self.additional_spinners()
+        print(f"no of extra spinners: {len(extra_spinners)}")
+
+        # if any spinner fails, the others are cancelled and the error is raised
+        async with asyncio.TaskGroup() as task_group:
+            task_group.create_task(self.__loop_outsim())
+            task_group.create_task(self.__outsim_interface.spin_insim())
+            for spinner in extra_spinners:
+                task_group.create_task(spinner)
+
     def spin(self) -> None:
+        install_fast_event_loop_policy()
         try:
-            extra_spinners = self.additional_spinners()
-            print(f"no of extra spinners: {len(extra_spinners)}")
             self.__start_running_windows_script_in_background()
-            awaitable = asyncio.gather(
-                self.__loop_outsim(),
-                self.__outsim_interface.spin_insim(),
-                *extra_spinners,
-            )
-
-            loop = asyncio.get_event_loop()
-            loop.run_until_complete(awaitable)
+            asyncio.run(self.__spin_async())
         except KeyboardInterrupt:
             if self.__windows_process is not None:
                 # gently ask the process to stop
@@ -1,36 +1,21 @@
 """
 Relay the desired steering, throttle and brake values to a VJoy device
 """
+import os
 import socket
 import struct
 import sys
+import time
 from itertools import count
 from typing import cast
 
 import pyvjoy
 
-
-def linearly_interpolate(
-    to_map: float, start1: float, stop1: float, start2: float, stop2: float
-) -> float:
-    """
-    Linearly maps a values `ns` with range `[start1-stop1]` to the range `[start2-stop2]`
-
-    Args:
-        to_map (float): The value to be mapped
-        start1 (float): The start of the original space
-        stop1 (float): The end of the original space
-        start2 (float): The start of the new space
-        stop2 (float): The end of the new space
-
-    Returns:
-        float: The mapped value
-    """
-    return (to_map - start1) / (stop1 - start1) * (stop2 - start2) + start2
-
-
 JOYSTICK_SOCKET = 30002
 
+# steering, throttle, brake, clutch, gear delta
+PACKET_STRUCT = struct.Struct("<4fi")
+
 
 def decode_packet(packet: bytes) -> tuple[float, float, float, float, int]:
     """
@@ -42,24 +27,17 @@ def decode_packet(packet: bytes) -> tuple[float, float, float, float, int]:
     Returns:
         The steering, throttle brake, clutch percentages as floats and the gear change as int
     """
-    fmt = "4fi"
-    values = cast(tuple[float, float, float, float, int], struct.unpack(fmt, packet))
+    values = cast(tuple[float, float, float, float, int], PACKET_STRUCT.unpack(packet))
     return values
 
 
-def map_to_axis(val: float, min_val: float, max_val: float) -> int:
-    """
-    Maps a value so that it matches the range of a VJoy axis
-
-    Args:
-        val (float): The value to map
-        min_val (float): The min value
-        max_val (float): The max value
-
-    Returns:
-        int: The mapped VJoy value
-    """
-    return int(linearly_interpolate(val, min_val, max_val, 0, 0x8000))
+# the maximum value of a VJoy axis
+AXIS_MAX = 0x8000
+# linear maps from the input ranges to [0, AXIS_MAX] as a scale and offset, the
+# steering is in [-1, 1] and the pedals in [0, 1]
+STEERING_AXIS_SCALE = AXIS_MAX / 2
+STEERING_AXIS_OFFSET = AXIS_MAX / 2
+PEDAL_AXIS_SCALE = AXIS_MAX
 
 
 def main() -> None:
@@ -77,8 +55,6 @@ def main() -> None:
     else:
         joystick_socket = JOYSTICK_SOCKET
 
-    import os
-
     print(os.getpid())
     try:
         j = pyvjoy.VJoyDevice(1)
@@ -87,36 +63,62 @@ def main() -> None:
             sock.bind(("0.0.0.0", joystick_socket))
             sock.settimeout(1.0)
 
+            # all the axes and buttons are written to the position struct of the
+            # device and sent to the driver with a single update call per packet
+            position = j.data
+            update = j.update
+            # button n is bit n - 1 of the buttons bitmask
+            shift_up_button_mask = 1 << 1
+            shift_down_button_mask = 1 << 0
+
             for _ in count():
                 # Receive data.
                 try:
-                    print("waiting for data")
                     data = sock.recv(64)
                 except socket.timeout:
-                    import time
-
+                    # only report waiting when nothing arrived, not before every packet
+                    print("waiting for data")
                     time.sleep(0.1)
                     continue
 
                 if not data:
                     break
 
+                # older commands are obsolete, drain the packets that queued up and
+                # only apply the latest one. a gear change from a dropped packet is
+                # kept so that shifts are not lost
                 steering, throttle, brake, clutch, gear_delta = decode_packet(data)
-
-                steering_axis_val = map_to_axis(steering, -1, 1)
-                throttle_axis_val = map_to_axis(throttle, 0, 1)
-                brake_axis_val = map_to_axis(brake, 0, 1)
-                clutch_axis_val = map_to_axis(clutch, 0, 1)
-
-                j.set_axis(pyvjoy.HID_USAGE_X, steering_axis_val)
-                j.set_axis(pyvjoy.HID_USAGE_Y, throttle_axis_val)
-                j.set_axis(pyvjoy.HID_USAGE_Z, brake_axis_val)
-                j.set_axis(pyvjoy.HID_USAGE_RX, clutch_axis_val)
-
-                shift_up_button = 2
-                shift_down_button = 1
-                j.set_button(shift_up_button, gear_delta > 0)
-                j.set_button(shift_down_button, gear_delta < 0)
+                sock.settimeout(0.0)
+                while True:
+                    try:
+                        data = sock.recv(64)
+                    except BlockingIOError:
+                        break
+                    (
+                        steering,
+                        throttle,
+                        brake,
+                        clutch,
+                        latest_gear_delta,
+                    ) = decode_packet(data)
+                    gear_delta = latest_gear_delta or gear_delta
+                sock.settimeout(1.0)
+
+                position.wAxisX = int(
+                    steering * STEERING_AXIS_SCALE + STEERING_AXIS_OFFSET
+                )
+                position.wAxisY = int(throttle * PEDAL_AXIS_SCALE)
+                position.wAxisZ = int(brake * PEDAL_AXIS_SCALE)
+                position.wAxisXRot = int(clutch * PEDAL_AXIS_SCALE)
+
+                if gear_delta > 0:
+                    position.lButtons = shift_up_button_mask
+                elif gear_delta < 0:
+                    position.lButtons = shift_down_button_mask
+                else:
+                    position.lButtons = 0
+
+                update()
 
     finally:
         j.reset()
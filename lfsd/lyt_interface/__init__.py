@@ -5,16 +5,34 @@ Provides a class that loads a lyt file and provides observations from a given ca
 """
 from __future__ import annotations
 
-from itertools import chain
 from pathlib import Path
 
 import numpy as np
 
-from lfsd.common_types import FloatArray
-from lfsd.lyt_interface.cone_observation import ConeTypes, ObservedCone
-from lfsd.lyt_interface.detection_model import DetectionModel
+from lfsd.common_types import FloatArray, IntArray
+from lfsd.lyt_interface.cone_observation import (
+    ConeTypes,
+    ObservedCone,
+    observed_cones_from_arrays,
+)
+from lfsd.lyt_interface.detection_model import (
+    BasicConicalDetectionModel,
+    DetectionModel,
+)
 from lfsd.lyt_interface.io.load_lyt import load_lyt_file
-from lfsd.math_utils import trace_to_local_space
+from lfsd.math_utils import (
+    MIN_CONES_FOR_PARALLEL_MASK,
+    trace_to_local_space,
+    visible_cones_local_space,
+)
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # scipy is optional, all the cones are scanned instead
+    cKDTree = None
+
+# for smaller tracks scanning all the cones is faster than querying a KD-tree
+MIN_CONES_FOR_KD_TREE = 256
 
 
 class LYTInterface:
@@ -43,27 +61,110 @@ class LYTInterface:
         # load the lyt file
         all_cones_per_type = load_lyt_file(self.lyt_path)
         self.all_cones_positions = np.concatenate(all_cones_per_type)
-        self.all_cones_types = np.array(
-            list(
-                chain.from_iterable([c] * len(all_cones_per_type[c]) for c in ConeTypes)
-            )
+        n_cones_per_type = [len(cones) for cones in all_cones_per_type]
+        self.all_cones_types = np.repeat(
+            np.arange(len(ConeTypes), dtype=np.int8), n_cones_per_type
         )
 
+        # the cones are grouped by type, so the cones of each type are a contiguous
+        # slice of the concatenated array
+        type_offsets = np.cumsum([0] + n_cones_per_type).tolist()
+        self._type_slices = [
+            slice(start, stop) for start, stop in zip(type_offsets, type_offsets[1:])
+        ]
+
+        # the cones do not move, so a KD-tree can be built once and used to only look
+        # at the cones that are in range of the car
+        self.cones_tree = None
+        n_cones = len(self.all_cones_positions)
+        if cKDTree is not None and n_cones >= MIN_CONES_FOR_KD_TREE:
+            self.cones_tree = cKDTree(self.all_cones_positions)
+
         self.detection_model = detection_model
 
-    def get_visible_cones(
+        # run the detection once, so that the detection kernel is compiled (or loaded
+        # from the cache) for the argument types used on every frame before the first
+        # frame arrives, user provided models are not run outside of a frame
+        if type(self.detection_model) is BasicConicalDetectionModel:
+            self.get_visible_cones_arrays(np.zeros(2), np.array([1.0, 0.0]))
+            # on large layouts the cones may be checked by the parallel kernel, which
+            # is not cached on disk, compile it now instead of on the first frame
+            # that needs it
+            if n_cones >= MIN_CONES_FOR_PARALLEL_MASK:
+                visible_cones_local_space(
+                    np.zeros(2),
+                    np.array([1.0, 0.0]),
+                    1.0,
+                    1.0,
+                    np.zeros((MIN_CONES_FOR_PARALLEL_MASK, 2)),
+                    np.empty((MIN_CONES_FOR_PARALLEL_MASK, 2)),
+                    np.empty(MIN_CONES_FOR_PARALLEL_MASK, dtype=np.int64),
+                )
+
+    def get_cones_by_type(self, cone_type: ConeTypes) -> FloatArray:
+        """
+        Returns the global positions of all the cones of the given type in the layout.
+        The returned array is a view into `all_cones_positions`, it must not be
+        modified.
+
+        Args:
+            cone_type: The type of the cones
+
+        Returns:
+            The positions of the cones with shape (n, 2)
+        """
+        return self.all_cones_positions[self._type_slices[cone_type]]
+
+    def get_visible_cones_arrays(
         self, car_pos: FloatArray, car_dir: FloatArray
-    ) -> list[ObservedCone]:
+    ) -> tuple[FloatArray, IntArray]:
         """
-        Returns a list of visible car cones according to their type
+        Returns the positions (in the car's local frame) and the types of the visible
+        cones as two parallel arrays
 
         Args:
             car_pos: The car's position as a 2d vector
             car_dir: The car's direction as a 2d vector
 
         Returns:
-            All the cones that are visible from the car's pov organized by type
+            The local positions of the visible cones with shape (n, 2) and their types
+            with shape (n,)
         """
+        # the basic conical model is a pure range and angle check, so detection and
+        # the transformation to local space can be done in a single pass
+        if type(self.detection_model) is BasicConicalDetectionModel:
+            detection_range = self.detection_model.detection_range
+
+            candidate_indices = None
+            candidate_positions = self.all_cones_positions
+            if self.cones_tree is not None:
+                candidate_indices = np.array(
+                    self.cones_tree.query_ball_point(
+                        car_pos, detection_range, return_sorted=True
+                    ),
+                    dtype=np.int64,
+                )
+                candidate_positions = self.all_cones_positions[candidate_indices]
+
+            n_candidates = len(candidate_positions)
+            out_positions = np.empty((n_candidates, 2))
+            out_indices = np.empty(n_candidates, dtype=np.int64)
+            n_visible = visible_cones_local_space(
+                car_pos,
+                car_dir,
+                self.detection_model.detection_range_sq,
+                self.detection_model.cos_half_detection_angle,
+                candidate_positions,
+                out_positions,
+                out_indices,
+            )
+
+            visible_indices = out_indices[:n_visible]
+            if candidate_indices is not None:
+                visible_indices = candidate_indices[visible_indices]
+
+            return out_positions[:n_visible], self.all_cones_types[visible_indices]
+
         # run the detection model
         (
             detected_cone_positions,
@@ -80,12 +181,26 @@ class LYTInterface:
             car_pos, car_dir, detected_cone_positions
         )
 
-        # convert to ObservedCone list
-        list_of_cones = [
-            ObservedCone(x=x, y=y, cone_type=ConeTypes(cone_type))
-            for (x, y), cone_type in zip(
-                detected_cone_positions_local, detected_cone_types
-            )
-        ]
+        return detected_cone_positions_local, detected_cone_types
 
-        return list_of_cones
+    def get_visible_cones(
+        self, car_pos: FloatArray, car_dir: FloatArray
+    ) -> list[ObservedCone]:
+        """
+        Returns a list of visible car cones according to their type
+
+        Args:
+            car_pos: The car's position as a 2d vector
+            car_dir: The car's direction as a 2d vector
+
+        Returns:
+            All the cones that are visible from the car's pov organized by type
+        """
+        (
+            detected_cone_positions_local,
+            detected_cone_types,
+        ) = self.get_visible_cones_arrays(car_pos, car_dir)
+
+        return observed_cones_from_arrays(
+            detected_cone_positions_local, detected_cone_types
+        )
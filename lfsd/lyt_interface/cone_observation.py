@@ -8,6 +8,8 @@ from __future__ import annotations
 from dataclasses import dataclass
 from enum import IntEnum
 
+import numpy as np
+
 
 class ConeTypes(IntEnum):
     """
@@ -22,7 +24,12 @@ class ConeTypes(IntEnum):
     START_FINISH_LINE = ORANGE_BIG = 4
 
 
-@dataclass
+# the cone types indexed by their value, indexing a list is much cheaper than
+# calling the enum
+_CONE_TYPES_BY_VALUE = list(ConeTypes)
+
+
+@dataclass(slots=True)
 class ObservedCone:
     """
     A class that represents a single cone that has been observed
@@ -31,3 +38,23 @@ class ObservedCone:
     x: float
     y: float
     cone_type: ConeTypes
+
+
+def observed_cones_from_arrays(
+    cones_positions: np.ndarray, cones_types: np.ndarray
+) -> list[ObservedCone]:
+    """
+    Create `ObservedCone` objects from parallel arrays of cone positions and types
+
+    Args:
+        cones_positions: The positions of the cones with shape (n, 2)
+        cones_types: The types of the cones with shape (n,)
+
+    Returns:
+        The cones as a list of `ObservedCone` objects
+    """
+    # convert to python scalars in bulk instead of one numpy scalar at a time
+    return [
+        ObservedCone(x=x, y=y, cone_type=_CONE_TYPES_BY_VALUE[cone_type])
+        for (x, y), cone_type in zip(cones_positions.tolist(), cones_types.tolist())
+    ]
@@ -1,9 +1,11 @@
+import math
 from typing import Protocol
 
-import numpy as np
-
 from lfsd.common_types import FloatArray, IntArray
-from lfsd.math_utils import cones_in_range_and_pov_mask
+from lfsd.math_utils import (
+    cones_in_range_and_pov_mask_precomputed,
+    cos_of_half_angle,
+)
 
 
 class DetectionModel(Protocol):
@@ -47,7 +49,11 @@ class BasicConicalDetectionModel(DetectionModel):
         self.detection_range = detection_range
 
         # convert to radians
-        self.detection_angle = np.deg2rad(detection_angle)
+        self.detection_angle = math.radians(detection_angle)
+
+        # precompute the thresholds that are compared against on every frame
+        self.detection_range_sq = detection_range * detection_range
+        self.cos_half_detection_angle = cos_of_half_angle(self.detection_angle)
 
     def detect_cones(
         self,
@@ -56,11 +62,11 @@ class BasicConicalDetectionModel(DetectionModel):
         cone_positions: FloatArray,
         cones_types: IntArray,
     ) -> tuple[FloatArray, IntArray]:
-        visible_mask = cones_in_range_and_pov_mask(
+        visible_mask = cones_in_range_and_pov_mask_precomputed(
             vehicle_position,
             vehicle_direction,
-            self.detection_range,
-            self.detection_angle,
+            self.detection_range_sq,
+            self.cos_half_detection_angle,
             cone_positions,
         )
 
@@ -7,11 +7,24 @@ from pathlib import Path
 from struct import Struct
 from typing import Dict
 
+import numpy as np
+
 from lfsd.common import get_lfs_path
 from lfsd.lyt_interface.cone_observation import ConeTypes
 
 HEADER_STRUCT = Struct("6sBBhBB")
 BLOCK_STRUCT = Struct("2h4B")
+# the same layout as `BLOCK_STRUCT`, used to decode all the blocks at once
+BLOCK_DTYPE = np.dtype(
+    [
+        ("x", "<i2"),
+        ("y", "<i2"),
+        ("z", "u1"),
+        ("flags", "u1"),
+        ("index", "u1"),
+        ("heading", "u1"),
+    ]
+)
 
 LytObjectIndexToConeType: Dict[int, ConeTypes] = {
     25: ConeTypes.UNKNOWN,
@@ -23,6 +36,11 @@ LytObjectIndexToConeType: Dict[int, ConeTypes] = {
     20: ConeTypes.ORANGE_SMALL,  # 20 is red but we use it to represent a small orange cone
 }
 
+# lookup table from lyt object index to cone type, -1 for objects that are not cones
+LYT_OBJECT_INDEX_TO_CONE_TYPE_LUT = np.full(256, -1, dtype=np.int8)
+for k, v in LytObjectIndexToConeType.items():
+    LYT_OBJECT_INDEX_TO_CONE_TYPE_LUT[k] = v
+
 ConeTypeToLytObjectIndex: Dict[ConeTypes, int] = {}
 for k, v in LytObjectIndexToConeType.items():
     if v not in ConeTypeToLytObjectIndex:
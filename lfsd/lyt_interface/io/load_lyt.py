@@ -13,16 +13,16 @@ import numpy as np
 from lfsd.common_types import FloatArray
 from lfsd.lyt_interface.cone_observation import ConeTypes
 from lfsd.lyt_interface.io.common import (
-    BLOCK_STRUCT,
+    BLOCK_DTYPE,
     HEADER_STRUCT,
-    LytObjectIndexToConeType,
+    LYT_OBJECT_INDEX_TO_CONE_TYPE_LUT,
 )
 
 
-def split_header_blocks(data: bytes) -> tuple[bytes, bytes]:
+def split_header_blocks(data: bytes) -> tuple[memoryview, memoryview]:
     """
     Split the content of the lyt file into header and block. This split is easy because
-    the header has a fixed size
+    the header has a fixed size. Both parts are views into `data`, nothing is copied
 
     Args:
         data: The content of the lyt file
@@ -30,10 +30,11 @@ def split_header_blocks(data: bytes) -> tuple[bytes, bytes]:
     Returns:
         The header and the block
     """
-    return data[: HEADER_STRUCT.size], data[HEADER_STRUCT.size :]
+    data_view = memoryview(data)
+    return data_view[: HEADER_STRUCT.size], data_view[HEADER_STRUCT.size :]
 
 
-def verify_lyt_header(header_data: bytes) -> None:
+def verify_lyt_header(header_data: bytes | memoryview) -> None:
     """
     Parse the header and perform some sanity checks suggested by the LFS documentation
 
@@ -53,37 +54,39 @@ def verify_lyt_header(header_data: bytes) -> None:
     assert revision <= 252, revision
 
 
-def extract_cone_lists(blocks_data: bytes) -> list[list[tuple[float, float]]]:
+def extract_cone_lists(blocks_data: bytes | memoryview) -> list[FloatArray]:
     """
     Extract the cone object positions from the object blocks bytes of a lyt file
 
     Args:
-        blocks_data (bytes): The data in the lyt file that is not the header
+        blocks_data: The data in the lyt file that is not the header
 
     Returns:
         The cone positions split by cone type
     """
-    decoded_blocks = BLOCK_STRUCT.iter_unpack(blocks_data)
-    all_cones_per_type: list[list[tuple[float, float]]] = [[] for _ in ConeTypes]
-
-    # cone_info:
-    for cone_info in decoded_blocks:
-        obj_x, obj_y, _, _, lyt_obj_idx, _ = cast(
-            tuple[int, int, int, int, int, int], cone_info
+    blocks = np.frombuffer(blocks_data, dtype=BLOCK_DTYPE)
+
+    # objects that are not cones are mapped to -1
+    cone_types = LYT_OBJECT_INDEX_TO_CONE_TYPE_LUT[blocks["index"]]
+    is_cone = cone_types >= 0
+    cone_types = cone_types[is_cone]
+
+    # the stored x,y pos is multiplied by
+    # 16 in the file so we need to convert it back. float32 represents
+    # every int16 / 16 exactly, at half the size of float64. 1/16 is a power
+    # of two, so multiplying by it in place is exact as well
+    cones_x = blocks["x"][is_cone].astype(np.float32)
+    cones_x *= np.float32(0.0625)
+    cones_y = blocks["y"][is_cone].astype(np.float32)
+    cones_y *= np.float32(0.0625)
+
+    all_cones_per_type = []
+    for cone_type in ConeTypes:
+        is_cone_type = cone_types == cone_type
+        all_cones_per_type.append(
+            np.column_stack((cones_x[is_cone_type], cones_y[is_cone_type]))
         )
 
-        try:
-            cone_type = LytObjectIndexToConeType[lyt_obj_idx]
-        except KeyError:
-            # not a cone
-            continue
-
-        # the stored x,y pos is multiplied by
-        # 16 in the file so we need to convert it back
-        # (and cast to a float by using real div)
-        obj_x_meters = obj_x / 16
-        obj_y_meters = obj_y / 16
-        all_cones_per_type[cone_type].append((obj_x_meters, obj_y_meters))
     return all_cones_per_type
 
 
@@ -96,8 +99,8 @@ def load_lyt_file(filename: Path | str) -> list[FloatArray]:
         filename (Path): The path to the `.lyt` file
 
     Returns:
-        List[np.ndarray]: A list of 2d np.ndarrays representing the cone positions of
-        for all cone types
+        List[np.ndarray]: A list of 2d float32 np.ndarrays representing the cone
+        positions of for all cone types
     """
     if isinstance(filename, str):
         filename = Path(filename)
@@ -107,10 +110,4 @@ def load_lyt_file(filename: Path | str) -> list[FloatArray]:
     header_data, blocks_data = split_header_blocks(data)
     verify_lyt_header(header_data)
 
-    all_cones_per_type = extract_cone_lists(blocks_data)
-
-    all_cones_per_type_arrays = [
-        np.array(cone_list).reshape(-1, 2) for cone_list in all_cones_per_type
-    ]
-
-    return all_cones_per_type_arrays
+    return extract_cone_lists(blocks_data)
@@ -5,8 +5,7 @@ Description: Write lyt files for LFS
 Given the cones of a track write a lyt file that can be used in LFS
 """
 
-
-from typing import cast
+from math import hypot
 
 import numpy as np
 from typing_extensions import Literal
@@ -14,7 +13,7 @@ from typing_extensions import Literal
 from lfsd.common_types import FloatArray
 from lfsd.lyt_interface.cone_observation import ConeTypes
 from lfsd.lyt_interface.io.common import (
-    BLOCK_STRUCT,
+    BLOCK_DTYPE,
     HEADER_STRUCT,
     ConeTypeToLytObjectIndex,
     get_lfs_layout_path,
@@ -35,96 +34,139 @@ def _to_lyt_heading(heading: float, input_is_radians: bool) -> np.ndarray:
         The heading is required by LYT
     """
     if input_is_radians:
-        heading = np.rad2deg(heading)
+        # scale straight from radians, without the detour through degrees
+        scale = 256.0 / (2 * np.pi)
+        return np.mod(heading * scale + 128.0, 256.0).astype(np.uint8)
     return ((heading + 180) * 256 // 360).astype(np.uint8)
 
 
-def _create_lyt_block_for_cone(
-    x_pos: int, y_pos: int, heading: int, color_index: int
-) -> bytes:
-    z_height = 240  # suggested by documentation (puts element on ground)
-    flags = 0  # these are simple cone objects no flags
-    block = BLOCK_STRUCT.pack(x_pos, y_pos, z_height, flags, color_index, heading)
-    return block
-
-
-def _create_lyt_trace_bytes(trace: np.ndarray, color_idx: int) -> bytes:
-    if len(trace) > 0:
-        trace_looped = cast(np.ndarray, np.vstack((trace, trace[:1])))
-        heading = angle_from_2d_vector(trace_looped[1:] - trace_looped[:-1])
-        # NOTE 2 in format
-        heading = _to_lyt_heading(heading, input_is_radians=True)
-        all_blocks = b"".join(
-            _create_lyt_block_for_cone(x, y, h, color_idx)
-            for (x, y), h in zip(trace, heading)
-        )
-        return all_blocks
-    return b""
-
+def _fill_lyt_trace_blocks(
+    blocks: np.ndarray, trace: np.ndarray, color_idx: int
+) -> None:
+    """
+    Fill the object blocks of a trace of cones of the same color
 
-def _create_start_block(x_pos: int, y_pos: int, heading: float) -> bytes:
+    Args:
+        blocks: The blocks to fill with shape (n,) and dtype `BLOCK_DTYPE`
+        trace: The positions of the cones in map units with shape (n, 2) and dtype
+            int16
+        color_idx: The lyt object index of the cones
+    """
+    if len(trace) == 0:
+        return
+
+    # the direction from each cone to the next one, the last cone points to the
+    # first one to close the loop. the differences can exceed the int16 range
+    diffs = np.empty(trace.shape, dtype=np.int32)
+    np.subtract(trace[1:], trace[:-1], out=diffs[:-1], dtype=np.int32)
+    np.subtract(trace[0], trace[-1], out=diffs[-1], dtype=np.int32)
+    # NOTE 2 in format, the angle is in [-pi, pi] so the scaled value is in [0, 256]
+    # and the integer cast floors it, 256 wraps around to 0 in the uint8 cast
+    heading = np.arctan2(diffs[:, 1], diffs[:, 0])
+    heading *= 128 / np.pi
+    heading += 128
+    heading = heading.astype(np.int32).astype(np.uint8)
+
+    blocks["x"] = trace[:, 0]
+    blocks["y"] = trace[:, 1]
+    blocks["z"] = 240  # suggested by documentation (puts element on ground)
+    blocks["flags"] = 0  # these are simple cone objects no flags
+    blocks["index"] = color_idx
+    blocks["heading"] = heading
+
+
+def _start_block_fields(x_pos: int, y_pos: int, heading: float) -> tuple:
     z_height = 240
     index = 0
     flags = 0  # start position has 0 width
     heading = _to_lyt_heading(heading, input_is_radians=True)
-    block = BLOCK_STRUCT.pack(x_pos, y_pos, z_height, flags, index, heading)
-    return block
+    return (x_pos, y_pos, z_height, flags, index, heading)
 
 
-def _create_finish_block(x_pos: int, y_pos: int, heading: float, width: float) -> bytes:
-    block = bytearray(_create_start_block(x_pos, y_pos, heading))
-    # width of finish object
-    block[5] |= int(width / 2) << 2
-    return bytes(block)
+def _finish_block_fields(x_pos: int, y_pos: int, heading: float, width: float) -> tuple:
+    z_height = 240
+    index = 0
+    flags = int(width / 2) << 2  # width of finish object
+    heading = _to_lyt_heading(heading, input_is_radians=True)
+    return (x_pos, y_pos, z_height, flags, index, heading)
 
 
-def _create_checkpoint_block(
+def _checkpoint_block_fields(
     x_pos: int,
     y_pos: int,
     heading: float,
     width: float,
     checkpoint_index: Literal[1, 2, 3],
-) -> bytes:
+) -> tuple:
     if checkpoint_index not in (1, 2, 3):
         raise ValueError(
             f"checkout_index must be either 1, 2 or 3. It is {checkpoint_index}"
         )
-    block = bytearray(_create_finish_block(x_pos, y_pos, heading, width))
-    block[5] |= checkpoint_index
-    return bytes(block)
+    z_height = 240
+    index = 0
+    # width of checkpoint object and which checkpoint it is
+    flags = int(width / 2) << 2 | checkpoint_index
+    heading = _to_lyt_heading(heading, input_is_radians=True)
+    return (x_pos, y_pos, z_height, flags, index, heading)
 
 
-def _traces_to_lyt_bytes(
-    cones_per_type: list[FloatArray], offset_in_meters: tuple[float, float]
-) -> bytes:
+def _traces_to_lyt_header_and_blocks(
+    cones_per_type: list[FloatArray], offset_in_meters: FloatArray
+) -> tuple[bytes, np.ndarray]:
     lfs_scale = 16
     offset = offset_in_meters * lfs_scale
 
-    cones_in_map = [(c * lfs_scale + offset).astype(int) for c in cones_per_type]
+    # transform the cones of all the types at once and split them up again afterwards
+    n_cones_per_type = [len(cones) for cones in cones_per_type]
+    all_cones = np.concatenate(cones_per_type)
+    all_cones_in_map = np.trunc(all_cones * lfs_scale + offset)
+
+    # the positions are stored as int16 in the lyt format
+    int16_info = np.iinfo(np.int16)
+    if len(all_cones_in_map) > 0 and (
+        all_cones_in_map.min() < int16_info.min
+        or all_cones_in_map.max() > int16_info.max
+    ):
+        raise ValueError("The cone positions do not fit in the lyt format")
+
+    cones_in_map = np.split(
+        all_cones_in_map.astype(np.int16), np.cumsum(n_cones_per_type)[:-1]
+    )
 
-    cones_bytes = [
-        _create_lyt_trace_bytes(cones, ConeTypeToLytObjectIndex[cone_type])
-        for cone_type, cones in zip(ConeTypes, cones_in_map)
-    ]
+    # the start, finish and checkpoint blocks come first, followed by the cones of
+    # each type. all the blocks are filled in a single array with the same layout as
+    # `BLOCK_STRUCT` and serialized at once
+    n_cones = sum(len(cones) for cones in cones_in_map)
+    all_blocks = np.empty(3 + n_cones, dtype=BLOCK_DTYPE)
+
+    start = 3
+    for cone_type, cones in zip(ConeTypes, cones_in_map):
+        stop = start + len(cones)
+        _fill_lyt_trace_blocks(
+            all_blocks[start:stop], cones, ConeTypeToLytObjectIndex[cone_type]
+        )
+        start = stop
 
-    right_in_map = cones_in_map[ConeTypes.RIGHT]
-    left_in_map = cones_in_map[ConeTypes.LEFT]
-    start_finish_in_map = cones_in_map[ConeTypes.START_FINISH_LINE]
+    # widen the cones that position the markers, so that their sums and differences
+    # do not overflow
+    right_in_map = cones_in_map[ConeTypes.RIGHT].astype(np.int32)
+    left_in_map = cones_in_map[ConeTypes.LEFT].astype(np.int32)
+    start_finish_in_map = cones_in_map[ConeTypes.START_FINISH_LINE].astype(np.int32)
 
     pos_x, pos_y = (left_in_map[-2] + right_in_map[-2]) // 2
     start_heading: float = (
         angle_from_2d_vector(left_in_map[-2] - left_in_map[-1]) + np.pi / 2
     )
-    start_block = _create_start_block(pos_x, pos_y, start_heading)
+    all_blocks[0] = _start_block_fields(pos_x, pos_y, start_heading)
 
     finish_pos_x, finish_pos_y = (start_finish_in_map[0] + start_finish_in_map[1]) // 2
 
     # divide by lfs_scale because we need actual width
     finish_width = 3 * (
-        np.linalg.norm(start_finish_in_map[0] - start_finish_in_map[1]) / lfs_scale
+        hypot(*(start_finish_in_map[0] - start_finish_in_map[1])) / lfs_scale
     )
     finish_heading = angle_from_2d_vector(left_in_map[-1] - left_in_map[0]) + np.pi / 2
-    finish_block = _create_finish_block(
+    all_blocks[1] = _finish_block_fields(
         finish_pos_x, finish_pos_y, finish_heading, finish_width
     )
 
@@ -132,32 +174,40 @@ def _traces_to_lyt_bytes(
     # this is so that lfs counts lap times
     half_len = len(left_in_map) // 2
     left_point_half = left_in_map[half_len]
-    right_point_half_index = np.linalg.norm(
-        left_point_half - right_in_map, axis=1
-    ).argmin(axis=0)
+    # the closest right cone, comparing squared distances avoids the sqrt
+    vec_to_right = right_in_map - left_point_half
+    right_point_half_index = np.einsum("ij,ij->i", vec_to_right, vec_to_right).argmin()
 
     right_point_half = right_in_map[right_point_half_index]
     check_pos_x, check_pos_y = (left_point_half + right_point_half) // 2
-    check_width = 5 * (np.linalg.norm(left_point_half - right_point_half) / lfs_scale)
+    check_width = 5 * (hypot(*(left_point_half - right_point_half)) / lfs_scale)
     check_heading = (
         angle_from_2d_vector(left_in_map[half_len - 1] - left_in_map[half_len])
         + np.pi / 2
     )
 
-    check_block = _create_checkpoint_block(
+    all_blocks[2] = _checkpoint_block_fields(
         check_pos_x, check_pos_y, check_heading, check_width, 1
     )
 
-    final_object_blocks = b"".join(
-        (start_block, finish_block, check_block, *cones_bytes)
-    )
+    header = HEADER_STRUCT.pack(b"LFSLYT", 0, 251, len(all_blocks), 10, 8)
+
+    return header, all_blocks
 
-    n_obj = len(final_object_blocks) // BLOCK_STRUCT.size
-    assert len(final_object_blocks) % BLOCK_STRUCT.size == 0
-    header = HEADER_STRUCT.pack(b"LFSLYT", 0, 251, n_obj, 10, 8)
 
-    final_bytes = b"".join((header, final_object_blocks))
-    return final_bytes
+# the offset of the layout in each world in meters, manually selected to be close to
+# center of the map
+_WORLD_OFFSETS = {
+    world_name: np.array(offset, dtype=np.float64)
+    for world_name, offset in {
+        "BL4": (-261, 124),
+        "AU1": (-50, -1010),
+        "AU2": (-138, -696),
+        "AU3": (-66, -50),
+        "WE3": (64, -1200),
+        "LA2": (538, 548),
+    }.items()
+}
 
 
 def write_traces_as_lyt(
@@ -178,24 +228,16 @@ def write_traces_as_lyt(
     lfs_layout_path = get_lfs_layout_path()
 
     try:
-        # manually selected to be close to center of the map
-        offset = {
-            "BL4": (-261, 124),
-            "AU1": (-50, -1010),
-            "AU2": (-138, -696),
-            "AU3": (-66, -50),
-            "WE3": (64, -1200),
-            "LA2": (538, 548),
-        }[world_name]
+        offset = _WORLD_OFFSETS[world_name]
     except KeyError as e:
         raise ValueError(f"Unknown world {world_name}") from e
 
-    offset = np.array(offset)
-
-    assert offset is not None
-
-    bytes_to_write = _traces_to_lyt_bytes(cones_per_type, offset)
+    header, all_blocks = _traces_to_lyt_header_and_blocks(cones_per_type, offset)
 
     filename = f"{world_name}_{layout_name}.lyt"
     path = lfs_layout_path / filename
-    path.write_bytes(bytes_to_write)
+    # the blocks are written straight from the array, without first joining them
+    # with the header into a copy of the whole file
+    with path.open("wb") as file:
+        file.write(header)
+        file.write(all_blocks.data)
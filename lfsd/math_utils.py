@@ -6,11 +6,23 @@ Project: FaSTTUBe Driverless Simulation
 Description: Functions for simulating cone detection when a global map of cones and the car pose
 is known
 """
+import math
 from typing import Tuple
 
 import numpy as np
 
-from lfsd.common_types import FloatArray
+from lfsd.common_types import FloatArray, IntArray
+
+try:
+    import numba
+    from numba import prange
+except ImportError:  # numba is optional, the numpy implementations are used instead
+    numba = None
+    prange = range
+
+# below this number of cones the cost of starting the threads outweighs the gain of
+# checking the cones in parallel
+MIN_CONES_FOR_PARALLEL_MASK = 4096
 
 
 def rotate(points: FloatArray, theta: float) -> FloatArray:
@@ -24,9 +36,72 @@ def rotate(points: FloatArray, theta: float) -> FloatArray:
     Returns:
         The points rotated
     """
-    cos_theta, sin_theta = np.cos(theta), np.sin(theta)
-    rotation_matrix = np.array(((cos_theta, -sin_theta), (sin_theta, cos_theta))).T
-    return np.dot(points, rotation_matrix)
+    return _rotate_by_cos_sin(points, np.cos(theta), np.sin(theta))
+
+
+def _rotate_by_cos_sin_into(
+    points: FloatArray, cos_theta: float, sin_theta: float, out: FloatArray
+) -> None:
+    """
+    Rotates the points in `points` around the origin by the angle whose cosine and
+    sine are given and writes the result to `out`
+
+    Args:
+        points: The points to rotate. Shape (n,2)
+        cos_theta: The cosine of the angle by which to rotate
+        sin_theta: The sine of the angle by which to rotate
+        out: The array to write the rotated points to. Same shape as `points`
+    """
+    points_x = points[..., 0]
+    points_y = points[..., 1]
+    out[..., 0] = points_x * cos_theta - points_y * sin_theta
+    out[..., 1] = points_x * sin_theta + points_y * cos_theta
+
+
+def _rotate_by_cos_sin_loop(
+    points: FloatArray, cos_theta: float, sin_theta: float, out: FloatArray
+) -> None:
+    """
+    Loop implementation of `_rotate_by_cos_sin_into` for points with shape (n,2),
+    compiled with numba when it is available
+    """
+    for i in range(points.shape[0]):
+        point_x = points[i, 0]
+        point_y = points[i, 1]
+        out[i, 0] = point_x * cos_theta - point_y * sin_theta
+        out[i, 1] = point_x * sin_theta + point_y * cos_theta
+
+
+if numba is not None:
+    _rotate_by_cos_sin_compiled = numba.njit(
+        cache=True, fastmath=True, boundscheck=False
+    )(_rotate_by_cos_sin_loop)
+else:
+    _rotate_by_cos_sin_compiled = None
+
+
+def _rotate_by_cos_sin(
+    points: FloatArray, cos_theta: float, sin_theta: float
+) -> FloatArray:
+    """
+    Rotates the points in `points` around the origin by the angle whose cosine and
+    sine are given. The rotation is applied to the columns directly instead of
+    building a rotation matrix
+
+    Args:
+        points: The points to rotate. Shape (n,2)
+        cos_theta: The cosine of the angle by which to rotate
+        sin_theta: The sine of the angle by which to rotate
+
+    Returns:
+        The points rotated
+    """
+    out = np.empty(points.shape, dtype=np.result_type(points, float))
+    if _rotate_by_cos_sin_compiled is not None and points.ndim == 2:
+        _rotate_by_cos_sin_compiled(points, float(cos_theta), float(sin_theta), out)
+    else:
+        _rotate_by_cos_sin_into(points, cos_theta, sin_theta, out)
+    return out
 
 
 def vec_dot(vecs1: np.ndarray, vecs2: np.ndarray) -> np.ndarray:
@@ -40,7 +115,8 @@ def vec_dot(vecs1: np.ndarray, vecs2: np.ndarray) -> np.ndarray:
     Returns:
         np.array: The results
     """
-    return np.sum(vecs1 * vecs2, axis=-1)
+    # multiply and reduce in a single pass, without an intermediate product array
+    return np.einsum("...i,...i->...", vecs1, vecs2)
 
 
 def vec_angle_between(
@@ -52,46 +128,174 @@ def vec_angle_between(
     Args:
         vecs1 (np.ndarray): An array of shape (...,2)
         vecs2 (np.ndarray): An array of shape (...,2)
-        clip_cos_theta (bool): Clip the values of the dot products so that they are
-        between -1 and 1. Defaults to True.
+        clip_cos_theta (bool): Kept for backwards compatibility. The angle is
+        calculated with arctan2, which needs no clipping, so it has no effect.
 
     Returns:
         np.ndarray: A vector, such that each element i contains the angle between
         vectors vecs1[i] and vecs2[i]
     """
-    cos_theta = vec_dot(vecs1, vecs2)
-
-    cos_theta /= np.linalg.norm(vecs1, axis=-1) * np.linalg.norm(vecs2, axis=-1)
-
-    cos_theta = np.asarray(cos_theta)
-
-    cos_theta_flat = cos_theta.ravel()
-
-    if clip_cos_theta:
-        cos_theta_flat[cos_theta_flat < -1] = -1
-        cos_theta_flat[cos_theta_flat > 1] = 1
+    # the angle is the arctan2 of the magnitude of the cross product and the dot
+    # product, which needs neither the norms of the vectors nor clipping
+    cross = vecs1[..., 0] * vecs2[..., 1] - vecs1[..., 1] * vecs2[..., 0]
+    dot = vecs1[..., 0] * vecs2[..., 0] + vecs1[..., 1] * vecs2[..., 1]
+    return np.arctan2(np.abs(cross), dot)
 
-    return np.arccos(cos_theta)
 
-
-def scramble_part(cones: np.ndarray) -> Tuple[np.ndarray, int]:
+def scramble_part(
+    cones: np.ndarray, rng: np.random.Generator | None = None
+) -> Tuple[np.ndarray, int]:
     """
     Scramles a set of cones, so that they are not in order anymore
 
     Args:
         cones (np.array): The cones that should be scrambled
+        rng (np.random.Generator | None): The random generator to use. If not
+        provided the global numpy random state is used, so `np.random.seed` applies
 
     Returns:
         Tuple[np.array, int]: Returns a set of cones in a different order, as well as the new index of the first cone in the old set
     """
-    idx = np.random.rand(len(cones)).argsort()
+    # a direct shuffle, instead of sorting random keys
+    if rng is None:
+        idx = np.random.permutation(len(cones))
+    else:
+        idx = rng.permutation(len(cones))
     random_cones = cones[idx]
 
-    index_of_first = np.argmax(idx == 0)
+    index_of_first = int(np.argmax(idx == 0))
 
     return random_cones, index_of_first
 
 
+def cos_of_half_angle(sight_angle: float) -> float:
+    """
+    Calculates the cosine of half the sight angle, which is the threshold for the
+    cosine of the angle between the car direction and a visible cone. Sight angles
+    larger than 2 pi are treated as 2 pi.
+
+    Args:
+        sight_angle: The sight angle in rad
+
+    Returns:
+        The cosine of half the sight angle
+    """
+    return math.cos(min(sight_angle / 2, math.pi))
+
+
+def _cones_in_range_and_pov_mask_loop(
+    car_pos: np.ndarray,
+    car_dir: np.ndarray,
+    sight_range_sq: float,
+    cos_half_sight_angle: float,
+    colored_cones: np.ndarray,
+) -> np.ndarray:
+    """
+    Same as `cones_in_range_and_pov_mask` but with the squared sight range and the
+    cosine of half the sight angle precomputed. No square root or inverse cosine is
+    calculated per cone.
+
+    Args:
+        car_pos: The global position of the car
+        car_dir: The direction of the car in global coordinates
+        sight_range_sq: The squared max distance that a cone can be seen
+        cos_half_sight_angle: The cosine of half the sight angle, see
+        `cos_of_half_angle`
+        colored_cones: The cones that define the track
+
+    Returns:
+        The mask of the visible cones
+    """
+    car_x, car_y = car_pos[0], car_pos[1]
+    car_dir_norm = math.hypot(car_dir[0], car_dir[1])
+    cos_car, sin_car = car_dir[0] / car_dir_norm, car_dir[1] / car_dir_norm
+    cos_half_sq = cos_half_sight_angle * cos_half_sight_angle
+    positive_cos_half = cos_half_sight_angle >= 0
+
+    n_cones = colored_cones.shape[0]
+    mask = np.zeros(n_cones, dtype=np.bool_)
+    # every cone is checked independently, so the loop can run in parallel
+    for i in prange(n_cones):
+        vec_x = colored_cones[i, 0] - car_x
+        vec_y = colored_cones[i, 1] - car_y
+        dist_sq = vec_x * vec_x + vec_y * vec_y
+        # a cone at the position of the car has no angle and is never visible
+        if dist_sq >= sight_range_sq or dist_sq == 0.0:
+            continue
+
+        dot = vec_x * cos_car + vec_y * sin_car
+        if positive_cos_half:
+            mask[i] = dot > 0.0 and dot * dot > cos_half_sq * dist_sq
+        else:
+            mask[i] = dot >= 0.0 or dot * dot < cos_half_sq * dist_sq
+
+    return mask
+
+
+def _cones_in_range_and_pov_mask_numpy(
+    car_pos: np.ndarray,
+    car_dir: np.ndarray,
+    sight_range_sq: float,
+    cos_half_sight_angle: float,
+    colored_cones: np.ndarray,
+) -> np.ndarray:
+    """
+    NumPy implementation of `cones_in_range_and_pov_mask_precomputed`, used when
+    numba is not available
+    """
+    car_dir_unit = car_dir / math.hypot(car_dir[0], car_dir[1])
+
+    vec_from_car = colored_cones - car_pos
+    dist_sq = np.einsum("ij,ij->i", vec_from_car, vec_from_car)
+    dot = vec_from_car @ car_dir_unit
+
+    # the angle to a cone is smaller than half the sight angle exactly when
+    # dot / dist > cos_half_sight_angle, compare the squares to avoid the sqrt
+    threshold_sq = cos_half_sight_angle * cos_half_sight_angle * dist_sq
+    if cos_half_sight_angle >= 0:
+        mask_angles = (dot > 0) & (dot * dot > threshold_sq)
+    else:
+        mask_angles = (dot >= 0) | (dot * dot < threshold_sq)
+
+    # a cone at the position of the car has no angle and is never visible
+    dist_mask = (dist_sq < sight_range_sq) & (dist_sq > 0)
+
+    return dist_mask & mask_angles
+
+
+if numba is not None:
+    _cones_in_range_and_pov_mask_serial = numba.njit(
+        cache=True, fastmath=True, boundscheck=False
+    )(_cones_in_range_and_pov_mask_loop)
+    # the on-disk cache does not distinguish the parallel variant of the same python
+    # function from the serial one, so only the serial kernel is cached
+    _cones_in_range_and_pov_mask_parallel = numba.njit(
+        parallel=True, fastmath=True, boundscheck=False
+    )(_cones_in_range_and_pov_mask_loop)
+
+    def cones_in_range_and_pov_mask_precomputed(
+        car_pos: np.ndarray,
+        car_dir: np.ndarray,
+        sight_range_sq: float,
+        cos_half_sight_angle: float,
+        colored_cones: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Compiled implementation of `cones_in_range_and_pov_mask_precomputed`, large
+        cone maps are checked on multiple threads
+        """
+        if len(colored_cones) >= MIN_CONES_FOR_PARALLEL_MASK:
+            kernel = _cones_in_range_and_pov_mask_parallel
+        else:
+            kernel = _cones_in_range_and_pov_mask_serial
+        return kernel(
+            car_pos, car_dir, sight_range_sq, cos_half_sight_angle, colored_cones
+        )
+
+else:
+    cones_in_range_and_pov_mask_precomputed = _cones_in_range_and_pov_mask_numpy
+
+
 def cones_in_range_and_pov_mask(
     car_pos: np.ndarray,
     car_dir: np.ndarray,
@@ -112,20 +316,14 @@ def cones_in_range_and_pov_mask(
     Returns:
         np.array: The indices of the visible cones
     """
-    dist_from_car = np.linalg.norm(car_pos - colored_cones, axis=1)
-    dist_mask = dist_from_car < sight_range
-
-    vec_from_car = colored_cones - car_pos
-
-    angles_to_car = vec_angle_between(car_dir[None], vec_from_car)
-    mask_angles = np.logical_and(
-        -sight_angle / 2 < angles_to_car, angles_to_car < sight_angle / 2
+    return cones_in_range_and_pov_mask_precomputed(
+        car_pos,
+        car_dir,
+        sight_range * sight_range,
+        cos_of_half_angle(sight_angle),
+        colored_cones,
     )
 
-    visible_cones_mask = np.logical_and(dist_mask, mask_angles)
-
-    return visible_cones_mask
-
 
 def trace_to_local_space(
     car_pos: np.ndarray, car_dir: np.ndarray, trace: np.ndarray
@@ -142,8 +340,140 @@ def trace_to_local_space(
         np.array: The rotated trace from the POV of the car
     """
 
-    car_angle = -np.arctan2(*car_dir[::-1])
-    return rotate(trace - car_pos, car_angle)
+    # the cosine and sine of the car angle are the components of the normalized
+    # direction, so no trigonometric functions need to be evaluated
+    car_dir_norm = math.hypot(car_dir[0], car_dir[1])
+    cos_car, sin_car = car_dir[0] / car_dir_norm, car_dir[1] / car_dir_norm
+    # rotate by the negative car angle
+    return _rotate_by_cos_sin(trace - car_pos, cos_car, -sin_car)
+
+
+def _visible_cones_local_space_loop(
+    car_pos: FloatArray,
+    car_dir: FloatArray,
+    sight_range_sq: float,
+    cos_half_sight_angle: float,
+    cones_positions: FloatArray,
+    out_positions: FloatArray,
+    out_indices: IntArray,
+) -> int:
+    """
+    Finds the cones that are visible from the car and transforms them to the local
+    space of the car in a single pass over the cones. This is equivalent to
+    `cones_in_range_and_pov_mask` followed by `trace_to_local_space`.
+
+    Args:
+        car_pos: The global position of the car
+        car_dir: The direction of the car in global coordinates
+        sight_range_sq: The squared max distance that a cone can be seen
+        cos_half_sight_angle: The cosine of half the sight angle, see
+        `cos_of_half_angle`
+        cones_positions: The global positions of the cones with shape (n, 2)
+        out_positions: The buffer to write the local positions of the visible cones
+        to, with the same shape as `cones_positions`
+        out_indices: The buffer to write the indices of the visible cones to, with
+        shape (n,)
+
+    Returns:
+        The number of visible cones, only this many rows of the output buffers are
+        written
+    """
+    car_x, car_y = car_pos[0], car_pos[1]
+    car_dir_norm = math.hypot(car_dir[0], car_dir[1])
+    cos_car, sin_car = car_dir[0] / car_dir_norm, car_dir[1] / car_dir_norm
+    cos_half_sq = cos_half_sight_angle * cos_half_sight_angle
+    positive_cos_half = cos_half_sight_angle >= 0
+
+    n_visible = 0
+    for i in range(cones_positions.shape[0]):
+        vec_x = cones_positions[i, 0] - car_x
+        vec_y = cones_positions[i, 1] - car_y
+        dist_sq = vec_x * vec_x + vec_y * vec_y
+        # a cone at the position of the car has no angle and is never visible
+        if dist_sq >= sight_range_sq or dist_sq == 0.0:
+            continue
+
+        # the local x coordinate is the projection on the direction of the car, the
+        # angle check compares the squares of local_x / dist and cos_half
+        local_x = vec_x * cos_car + vec_y * sin_car
+        local_x_sq = local_x * local_x
+        if positive_cos_half:
+            if local_x <= 0.0 or local_x_sq <= cos_half_sq * dist_sq:
+                continue
+        elif local_x < 0.0 and local_x_sq >= cos_half_sq * dist_sq:
+            continue
+
+        out_positions[n_visible, 0] = local_x
+        out_positions[n_visible, 1] = vec_y * cos_car - vec_x * sin_car
+        out_indices[n_visible] = i
+        n_visible += 1
+
+    return n_visible
+
+
+def _visible_cones_local_space_numpy(
+    car_pos: FloatArray,
+    car_dir: FloatArray,
+    sight_range_sq: float,
+    cos_half_sight_angle: float,
+    cones_positions: FloatArray,
+    out_positions: FloatArray,
+    out_indices: IntArray,
+) -> int:
+    """
+    NumPy implementation of `visible_cones_local_space`, used when numba is not
+    available and on large cone maps, whose mask is then computed in parallel
+    """
+    visible_mask = cones_in_range_and_pov_mask_precomputed(
+        car_pos, car_dir, sight_range_sq, cos_half_sight_angle, cones_positions
+    )
+    (visible_indices,) = np.nonzero(visible_mask)
+    n_visible = len(visible_indices)
+
+    out_indices[:n_visible] = visible_indices
+    out_positions[:n_visible] = trace_to_local_space(
+        car_pos, car_dir, cones_positions[visible_indices]
+    )
+
+    return n_visible
+
+
+if numba is not None:
+    # the compiled kernel is cached on disk so that it is only compiled once
+    _visible_cones_local_space_serial = numba.njit(
+        cache=True, fastmath=True, boundscheck=False
+    )(_visible_cones_local_space_loop)
+
+    def visible_cones_local_space(
+        car_pos: FloatArray,
+        car_dir: FloatArray,
+        sight_range_sq: float,
+        cos_half_sight_angle: float,
+        cones_positions: FloatArray,
+        out_positions: FloatArray,
+        out_indices: IntArray,
+    ) -> int:
+        """
+        Compiled implementation of `visible_cones_local_space`, on large cone maps
+        the cones are checked on multiple threads and only the visible ones are
+        transformed afterwards
+        """
+        if len(cones_positions) >= MIN_CONES_FOR_PARALLEL_MASK:
+            kernel = _visible_cones_local_space_numpy
+        else:
+            kernel = _visible_cones_local_space_serial
+        return kernel(
+            car_pos,
+            car_dir,
+            sight_range_sq,
+            cos_half_sight_angle,
+            cones_positions,
+            out_positions,
+            out_indices,
+        )
+
+else:
+    visible_cones_local_space = _visible_cones_local_space_numpy
 
 
 def trace_to_global_space(
@@ -160,8 +490,10 @@ def trace_to_global_space(
     Returns:
         np.array: The position of the trace in the global space
     """
-    car_angle = -np.arctan2(*car_dir[::-1])
-    return rotate(trace, car_angle) + car_pos
+    car_dir_norm = math.hypot(car_dir[0], car_dir[1])
+    cos_car, sin_car = car_dir[0] / car_dir_norm, car_dir[1] / car_dir_norm
+    # rotate by the negative car angle
+    return _rotate_by_cos_sin(trace, cos_car, -sin_car) + car_pos
 
 
 def angle_from_2d_vector(vecs: np.ndarray) -> np.ndarray:
@@ -175,7 +507,8 @@ def angle_from_2d_vector(vecs: np.ndarray) -> np.ndarray:
     >>> array([0.        , 0.78539816, 1.57079633])
 
     Args:
-        vecs (np.array): The vectors for which the angle is calculated
+        vecs (np.array): The vectors for which the angle is calculated, the last
+            dimension must have size 2
 
     Raises:
         ValueError: If `vecs` has the wrong shape a ValueError is raised
@@ -183,11 +516,9 @@ def angle_from_2d_vector(vecs: np.ndarray) -> np.ndarray:
     Returns:
         np.array: The angle of each vector in `vecs`
     """
-    if vecs.shape == (2,):
-        return np.arctan2(vecs[1], vecs[0])
-    if vecs.ndim == 2 and vecs.shape[-1] == 2:
-        return np.arctan2(vecs[:, 1], vecs[:, 0])
-    raise ValueError("vecs can either be a 2d vector or an array of 2d vectors")
+    if vecs.ndim == 0 or vecs.shape[-1] != 2:
+        raise ValueError("vecs can either be a 2d vector or an array of 2d vectors")
+    return np.arctan2(vecs[..., 1], vecs[..., 0])
 
 
 def unit_2d_vector_from_angle(rad: np.ndarray) -> np.ndarray:
@@ -201,8 +532,9 @@ def unit_2d_vector_from_angle(rad: np.ndarray) -> np.ndarray:
         np.array: The created unit vectors
     """
     rad = np.asarray(rad)
-    new_shape = rad.shape + (2,)
-    res = np.empty(new_shape, dtype=rad.dtype)
-    res[..., 0] = np.cos(rad)
-    res[..., 1] = np.sin(rad)
-    return res
+    if rad.ndim == 0:
+        # a single angle (e.g. the car's yaw on every frame) is cheaper to handle
+        # with python floats than with numpy ufuncs
+        angle = float(rad)
+        return np.array([math.cos(angle), math.sin(angle)], dtype=rad.dtype)
+    return np.stack((np.cos(rad), np.sin(rad)), axis=-1)
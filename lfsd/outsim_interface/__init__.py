@@ -8,22 +8,23 @@ from __future__ import annotations
 import asyncio as aio
 import struct
 import sys
-from asyncio.streams import StreamReader, StreamWriter
+from collections import deque
 from dataclasses import dataclass
 from itertools import count
 from pathlib import Path
-from time import time
-from typing import Any, AsyncIterator, List, Tuple
+from time import perf_counter, time
+from typing import Any, AsyncIterator, Tuple
 
 import asyncio_dgram
 import numpy as np
-from asyncio_dgram.aio import DatagramClient, DatagramServer
+from asyncio_dgram.aio import DatagramClient
 
 from lfsd.common import get_lfs_cfg_txt_path, get_machine_ip_address, is_wsl2
 from lfsd.lyt_interface import LYTInterface
 from lfsd.lyt_interface.detection_model import DetectionModel
 from lfsd.outsim_interface.functional import ProcessedOutsimData, process_outsim_data
 from lfsd.outsim_interface.insim_utils import (
+    InSimProtocol,
     create_insim_initialization_packet,
     handle_insim_packet,
 )
@@ -33,9 +34,14 @@ from lfsd.outsim_interface.outsim_utils import (
     decode_full_outsim_packet,
     decode_outgauge_data,
 )
+from lfsd.outsim_interface.udp_utils import BatchedDatagramReceiver
 
+# steering, throttle, brake, clutch, gear delta, must match the struct that
+# `lfs_windows_output.py` decodes
+VJOY_PACKET_STRUCT = struct.Struct("<4fi")
 
-@dataclass
+
+@dataclass(slots=True)
 class LFSData:
     """
     Represents the data that has been extracted out of the LFS sim and that now can be
@@ -73,9 +79,9 @@ class OutsimInterface:
             detection_model: The detection model to use for detecting cones.
         """
         self.outsim_port: int
-        self.outsim_asocket: DatagramServer
+        self.outsim_asocket: BatchedDatagramReceiver
         self.outgauge_port: int
-        self.outgauge_asocket: DatagramServer
+        self.outgauge_asocket: BatchedDatagramReceiver
 
         self.vjoy_port = vjoy_port
         self.vjoy_asocket: DatagramClient
@@ -189,15 +195,8 @@ class OutsimInterface:
     async def __aenter__(self) -> OutsimInterface:
         """Connect to outsim with udp and wait for the layout to be loaded"""
 
-        self.outsim_asocket = await asyncio_dgram.bind(  # type: ignore
-            (
-                "0.0.0.0",
-                self.outsim_port,
-            )
-        )
-        self.outgauge_asocket = await asyncio_dgram.bind(  # type: ignore
-            ("0.0.0.0", self.outgauge_port)
-        )
+        self.outsim_asocket = BatchedDatagramReceiver(self.outsim_port)
+        self.outgauge_asocket = BatchedDatagramReceiver(self.outgauge_port)
 
         print(
             f"connecting to vjoy: address: {self.game_address}, port: {self.vjoy_port}"
@@ -220,7 +219,7 @@ class OutsimInterface:
 
     async def connect_to_insim(
         self, retry_every_n_seconds: int
-    ) -> Tuple[StreamReader, StreamWriter, bytes]:
+    ) -> Tuple[aio.WriteTransport, InSimProtocol]:
         """
         Try to connect to LFS insim using TCP. An infinite loop is started that
         tries to connect to the insim port every n seconds.
@@ -229,17 +228,20 @@ class OutsimInterface:
             retry_every_n_seconds: The number of seconds to wait before retrying.
 
         Returns:
-            The reader, writer and a buffer to use for storing further incoming data
-            from insim.
+            The transport to use for sending data to insim and the protocol that
+            receives and handles the incoming data.
         """
         print(
             f"Attempting to connect to insim...\nConnecting to port: {self.insim_port}"
         )
 
+        loop = aio.get_running_loop()
         for connection_attempt in count(start=1):
             try:
-                reader, writer = await aio.open_connection(
-                    self.game_address, self.insim_port
+                transport, protocol = await loop.create_connection(
+                    lambda: InSimProtocol(self.handle_insim_buffer),
+                    self.game_address,
+                    self.insim_port,
                 )
             except ConnectionRefusedError:
                 print(
@@ -258,40 +260,45 @@ class OutsimInterface:
 
         # send initialization packet
         initialization_packet = create_insim_initialization_packet("lfsd", "")
-        writer.write(initialization_packet)
-        await writer.drain()
+        transport.write(initialization_packet)
 
         # send packet requesting the name of the active layout
         buffer_to_send_for_axi_request = bytes([4, 3, 1, 20])
-        writer.write(buffer_to_send_for_axi_request)
-        await writer.drain()
+        transport.write(buffer_to_send_for_axi_request)
 
-        new_buffer = b""
+        return transport, protocol
 
-        return reader, writer, new_buffer
-
-    def handle_insim_buffer(self, buffer: bytes, writer: StreamWriter) -> bytes:
+    def handle_insim_buffer(
+        self, buffer: memoryview, writer: aio.WriteTransport
+    ) -> int:
         """
         Work with the data already received from insim. The buffer is iterated
         and every packet that is found is handled by the `handle_insim_packet` method.
 
         Args:
             buffer: The buffer containing incoming insim data.
-            writer: The writer to use for sending data to insim. Mainly needed to
+            writer: The transport to use for sending data to insim. Mainly needed to
             send keepalive packets.
 
         Returns:
-            The remaining buffer to be processed, containing incomplete data.
+            The number of bytes that were handled, the rest of the buffer contains
+            incomplete data.
         """
         # Loop through each completed packet in the buffer. The first byte of
         # each packet is the packet size, so check that the length of the
         # buffer is at least the size of the first packet.
-        while len(buffer) > 0 and len(buffer) > buffer[0]:
-            # Copy the packet from the buffer.
-            packet = buffer[: buffer[0]]
+        offset = 0
+        buffer_length = len(buffer)
+        while offset < buffer_length:
+            packet_size = buffer[offset]
+            if buffer_length - offset < packet_size:
+                break
+
+            # Slice the packet from the buffer, slicing a view does not copy.
+            packet = buffer[offset : offset + packet_size]
 
-            # Remove the packet from the buffer.
-            buffer = buffer[buffer[0] :]
+            # Skip the packet in the buffer.
+            offset += packet_size
 
             # The packet is now complete! :)
             to_send, layout = handle_insim_packet(packet)
@@ -301,31 +308,24 @@ class OutsimInterface:
                 self.active_layout_name = layout
                 self.reload_lyt_interface()
 
-        return buffer
+        return offset
 
     async def spin_insim(self) -> None:
         """
         Get the insim data and update the current track
         """
         retry_every_n_seconds = 5
-        reader, writer, buffer = await self.connect_to_insim(retry_every_n_seconds)
 
         for _ in count():
-            data = await reader.read(1024)
-            # Append received data onto the buffer.
-            buffer += data
-            buffer = self.handle_insim_buffer(buffer, writer)
-
-            # When we receive an empty string that means the connection has been
-            # closed.
-            if len(data) == 0:
-                writer.close()
-                await writer.wait_closed()
-
-                print("Connection reset from LFS insim. Will attempt to reconnect...")
-                reader, writer, buffer = await self.connect_to_insim(
-                    retry_every_n_seconds
-                )
+            # the incoming data is handled by the protocol as it arrives
+            transport, protocol = await self.connect_to_insim(retry_every_n_seconds)
+            try:
+                # raises the errors of the packet handling, e.g. a missing layout file
+                await protocol.closed
+            finally:
+                transport.close()
+
+            print("Connection reset from LFS insim. Will attempt to reconnect...")
 
     async def __aexit__(self, *args: Any, **kwargs: Any) -> Any:
         """Disconnect from outsim"""
@@ -344,19 +344,30 @@ class OutsimInterface:
         Yields:
             LFSData: The parsed data as a dataclass
         """
-        delta_ts: List[float] = []
+        # the last delta_ts and their sum, so that the mean is a single division
+        delta_ts: deque[float] = deque(maxlen=31)
+        delta_ts_sum = 0.0
 
-        time_before = time()
+        # frames are timed with the monotonic high resolution clock, the offset
+        # converts it back to wall clock time for the timestamp
+        epoch_offset = time() - perf_counter()
+        time_before = perf_counter()
 
-        previous_angular_velocity = np.array([0, 0, 0])
+        # the previous angular velocity is copied into the same float array on every
+        # frame instead of keeping a reference to the new one
+        previous_angular_velocity = np.zeros(3)
 
-        outsim_bytes: bytes
+        outsim_bytes: memoryview
+
+        # `__aenter__` only returns once a layout is loaded, and a reload only ever
+        # replaces it with a new one, so there is no need to check it on every frame
+        assert self.lyt_interface is not None
 
         for i in count():
-            (outsim_bytes, _), (outgauge_bytes, _) = await aio.gather(
+            outsim_bytes, outgauge_bytes = await aio.gather(
                 self.outsim_asocket.recv(), self.outgauge_asocket.recv()
             )
-            time_after = time()
+            time_after = perf_counter()
             delta_t = time_after - time_before
 
             raw_outsim_data = decode_full_outsim_packet(outsim_bytes)
@@ -367,24 +378,25 @@ class OutsimInterface:
             # use the real world delta_t, instead we get the average
             # of the last few runs, since delta_t has a very low variance (it is
             # effectively the games fps) this is a safe assumption to make
-            if i > 50 and len(delta_ts) > 0 and delta_t > 3 * np.mean(delta_ts):
-                delta_t = np.mean(delta_ts)
-
-            delta_ts = delta_ts[-30:] + [delta_t]
+            if i > 50 and len(delta_ts) > 0:
+                mean_delta_t = delta_ts_sum / len(delta_ts)
+                if delta_t > 3 * mean_delta_t:
+                    delta_t = mean_delta_t
 
-            assert self.lyt_interface is not None
+            if len(delta_ts) == delta_ts.maxlen:
+                delta_ts_sum -= delta_ts[0]
+            delta_ts.append(delta_t)
+            delta_ts_sum += delta_t
 
             processed_outsim_data = process_outsim_data(
                 delta_t, self.lyt_interface, previous_angular_velocity, raw_outsim_data
             )
 
-            time_before, previous_angular_velocity = (
-                time_after,
-                raw_outsim_data.angular_velocity,
-            )
+            time_before = time_after
+            previous_angular_velocity[:] = raw_outsim_data.angular_velocity
 
             data = LFSData(
-                timestamp=time_after,
+                timestamp=epoch_offset + time_after,
                 delta_t=delta_t,
                 raw_outsim_data=raw_outsim_data,
                 processed_outsim_data=processed_outsim_data,
@@ -413,9 +425,7 @@ class OutsimInterface:
             clutch_percentage: The percentage of the clutch (0 no clutch, 1 full clutch)
             gear_delta: The gear delta (-1 downshift, 0 neutral, 1 upshift)
         """
-        fmt = "4fi"
-        packet = struct.pack(
-            fmt,
+        packet = VJOY_PACKET_STRUCT.pack(
             steering_percentage,
             throttle_percentage,
             brake_percentage,
@@ -7,9 +7,12 @@ from dataclasses import dataclass
 
 import numpy as np
 
-from lfsd.common_types import FloatArray
+from lfsd.common_types import FloatArray, IntArray
 from lfsd.lyt_interface import LYTInterface
-from lfsd.lyt_interface.cone_observation import ObservedCone
+from lfsd.lyt_interface.cone_observation import (
+    ObservedCone,
+    observed_cones_from_arrays,
+)
 from lfsd.math_utils import unit_2d_vector_from_angle
 from lfsd.outsim_interface.outsim_utils import RawOutsimData
 
@@ -24,13 +27,30 @@ def calc_derivative(
     return derivative_value
 
 
-@dataclass
+@dataclass(slots=True)
 class ProcessedOutsimData:
-    visible_cones: list[ObservedCone]
+    """
+    The data derived from an outsim packet. The visible cones are stored as
+    parallel position and type arrays, `visible_cones` is derived from them and is
+    not a constructor argument anymore.
+    """
+
+    visible_cones_positions: FloatArray
+    visible_cones_types: IntArray
     linear_velocity_local: np.ndarray
     linear_acceleration_local: np.ndarray
     angular_acceleration: np.ndarray
 
+    @property
+    def visible_cones(self) -> list[ObservedCone]:
+        """
+        The visible cones as a list of `ObservedCone` objects. The list is created on
+        every access, prefer `visible_cones_positions` and `visible_cones_types`.
+        """
+        return observed_cones_from_arrays(
+            self.visible_cones_positions, self.visible_cones_types
+        )
+
 
 def world_to_local(
     world_vector: FloatArray, pitch: float, roll: float, yaw: float
@@ -106,9 +126,10 @@ def process_outsim_data(
     direction_global_xy = unit_2d_vector_from_angle(yaw)
     position_global_xy = raw_outsim_data.position_global[:2]
 
-    cone_observation = cone_interface.get_visible_cones(
-        position_global_xy, direction_global_xy
-    )
+    (
+        visible_cones_positions,
+        visible_cones_types,
+    ) = cone_interface.get_visible_cones_arrays(position_global_xy, direction_global_xy)
 
     angular_acceleration = calc_derivative(
         delta_t, raw_outsim_data.angular_velocity, previous_angular_velocity
@@ -123,7 +144,8 @@ def process_outsim_data(
     )
 
     return ProcessedOutsimData(
-        visible_cones=cone_observation,
+        visible_cones_positions=visible_cones_positions,
+        visible_cones_types=visible_cones_types,
         linear_velocity_local=linear_velocity_local,
         linear_acceleration_local=linear_acceleration_local,
         angular_acceleration=angular_acceleration,
@@ -8,8 +8,9 @@ know the current track layout loaded.
 Project: FaSTTUBe Driverless Simulation
 """
 
+import asyncio as aio
 import struct
-from typing import Optional, Tuple
+from typing import Callable, Optional, Tuple, cast
 
 
 def create_insim_initialization_packet(program_name: str, password: str) -> bytes:
@@ -41,7 +42,9 @@ def create_insim_initialization_packet(program_name: str, password: str) -> byte
     return isi
 
 
-def handle_insim_packet(packet: bytes) -> tuple[bytes | None, str | None]:
+def handle_insim_packet(
+    packet: bytes | memoryview,
+) -> tuple[bytes | None, str | None]:
     """
     Handle an insim packet. It only handles the minimum number of packets that we
     need. This is not an full insim client.
@@ -66,7 +69,8 @@ def handle_insim_packet(packet: bytes) -> tuple[bytes | None, str | None]:
         tiny = struct.unpack("BBBB", packet)
         # Check the SubT.
         if tiny[3] == tiny_none:
-            return packet, None
+            # copy, a view of the receive buffer is overwritten by the next packets
+            return bytes(packet), None
 
     elif packet_type == isp_axi:
         name: bytes
@@ -76,3 +80,63 @@ def handle_insim_packet(packet: bytes) -> tuple[bytes | None, str | None]:
         pass
 
     return None, None
+
+
+class InSimProtocol(aio.BufferedProtocol):
+    """
+    Receives the insim stream directly into a preallocated buffer, instead of
+    creating a bytes object for every read and appending it to a buffer. After
+    every read the complete packets are handed to `handle_buffer` and the
+    incomplete rest is moved to the start of the buffer, once per read.
+    """
+
+    def __init__(
+        self,
+        handle_buffer: Callable[[memoryview, aio.WriteTransport], int],
+        buffer_size: int = 65536,
+    ) -> None:
+        """
+        Args:
+            handle_buffer: Called with the received data and the transport. Handles
+            all the complete packets and returns the number of bytes handled.
+            buffer_size: The size of the receive buffer in bytes
+        """
+        self._handle_buffer = handle_buffer
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._write_offset = 0
+        self._transport: aio.WriteTransport | None = None
+        # resolved when the connection is lost, or set to the exception raised by
+        # `handle_buffer`
+        self.closed = aio.get_running_loop().create_future()
+
+    def connection_made(self, transport: aio.BaseTransport) -> None:
+        self._transport = cast(aio.WriteTransport, transport)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self._view[self._write_offset :]
+
+    def buffer_updated(self, nbytes: int) -> None:
+        assert self._transport is not None
+        self._write_offset += nbytes
+        try:
+            n_handled = self._handle_buffer(
+                self._view[: self._write_offset], self._transport
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            # the transport would only log the error and close the connection, pass
+            # it on to whoever awaits `closed` instead, so that it is not swallowed
+            if not self.closed.done():
+                self.closed.set_exception(exc)
+            self._transport.abort()
+            return
+
+        # only the incomplete packet at the end is left, move it to the start
+        n_remaining = self._write_offset - n_handled
+        if n_handled > 0 and n_remaining > 0:
+            self._buffer[:n_remaining] = self._buffer[n_handled : self._write_offset]
+        self._write_offset = n_remaining
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        if not self.closed.done():
+            self.closed.set_result(None)
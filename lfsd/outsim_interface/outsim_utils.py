@@ -39,7 +39,7 @@ Bar = float
 MetersPerSecond = float
 
 
-@dataclass
+@dataclass(slots=True)
 class CarInputs:
     steering: Radians
     throttle: Ratio
@@ -48,20 +48,20 @@ class CarInputs:
     handbrake: Ratio
 
 
-@dataclass
+@dataclass(slots=True)
 class CarDrive:
     gear: int
     engine_angular_velocity: RadiansPerSecond
     max_torque_at_velocity: NewtonMeters  # Nm : output torque for throttle 1.0
 
 
-@dataclass
+@dataclass(slots=True)
 class Distance:
     current_lap_dist: Meters
     indexed_distance: Meters
 
 
-@dataclass  # pylint: disable=too-many-instance-attributes
+@dataclass(slots=True)  # pylint: disable=too-many-instance-attributes
 class WheelData:
     """
     The data provided by outsim regarding one wheel
@@ -81,7 +81,7 @@ class WheelData:
     tan_slip_angle: float
 
 
-@dataclass
+@dataclass(slots=True)
 class RawOutsimData:
     """
     A class that contains all the data provided by outsim
@@ -101,13 +101,13 @@ class RawOutsimData:
 
 
 def decode_full_outsim_packet(
-    packet: bytes,
+    packet: bytes | memoryview,
 ) -> RawOutsimData:
     """
     Decodes an extended outsim and returns relevant values, that contains wheel/tyre data etc.
 
     Args:
-        packet (bytes): The extended outsim packet
+        packet (bytes | memoryview): The extended outsim packet
 
     Returns:
        RawOutsimData: The parsed outsim data in a structured dataclass
@@ -117,8 +117,8 @@ def decode_full_outsim_packet(
 
     res = cast(OUTSIM_FULL_UNPACK_TYPE, OUTSIM_FULL_STRUCT.unpack(packet))
 
-    # header
-    assert b"".join(res[:4]) == b"LFST"
+    # header, compared on the packet itself instead of joining the unpacked chars
+    assert packet[:4] == b"LFST"
     packet_id, packet_time = res[4:6]
 
     # main
@@ -288,11 +288,12 @@ OUTGAUGE_FULL_UNPACK_TYPE = Tuple[
 ]
 
 
-@dataclass
+@dataclass(slots=True)
 class RawOutgaugeData:
     time: int
     car: str
     gear: int
+    player_id: int
     speed: MetersPerSecond
     rpm: float  # rpm
     turbo_pressure: Bar  # bar
@@ -302,7 +303,7 @@ class RawOutgaugeData:
     oil_temperature: Celsius
 
 
-def decode_outgauge_data(data: bytes) -> RawOutgaugeData:
+def decode_outgauge_data(data: bytes | memoryview) -> RawOutgaugeData:
     outgauge_pack = cast(OUTGAUGE_FULL_UNPACK_TYPE, OUTGAUGE_STRUCT.unpack(data))
 
     try:
@@ -313,6 +314,7 @@ def decode_outgauge_data(data: bytes) -> RawOutgaugeData:
         time=outgauge_pack[0],
         car=car,
         gear=outgauge_pack[3],
+        player_id=outgauge_pack[4],
         speed=outgauge_pack[5],
         rpm=outgauge_pack[6],
         turbo_pressure=outgauge_pack[7],
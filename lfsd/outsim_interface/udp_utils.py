@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+"""
+Provides a UDP receiver that reads queued datagrams in batches
+"""
+import asyncio as aio
+import socket
+from collections import deque
+
+
+class BatchedDatagramReceiver:
+    """
+    A non-blocking UDP socket that is read in batches. Every time the event loop
+    wakes up because a datagram arrived, all datagrams that are already queued (up
+    to `batch_size`) are read without awaiting again. Bursts of packets therefore
+    cost a single event loop wakeup instead of one per packet.
+
+    The datagrams are received into preallocated buffers, one per datagram of a
+    batch, so no new bytes object is created per datagram.
+    """
+
+    def __init__(
+        self, port: int, batch_size: int = 32, max_datagram_size: int = 1024
+    ) -> None:
+        """
+        Create the socket and bind it to the provided port on all interfaces.
+
+        Args:
+            port: The port to bind to
+            batch_size: The maximum number of datagrams read per wakeup
+            max_datagram_size: The maximum size of a single datagram in bytes
+        """
+        self.batch_size = batch_size
+        self.max_datagram_size = max_datagram_size
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._sock.bind(("0.0.0.0", port))
+
+        # one slot per datagram of a batch, a slot is only reused by the next batch
+        self._buffer = bytearray(batch_size * max_datagram_size)
+        buffer_view = memoryview(self._buffer)
+        self._slots = [
+            buffer_view[start : start + max_datagram_size]
+            for start in range(0, len(self._buffer), max_datagram_size)
+        ]
+
+        self._pending: deque[memoryview] = deque()
+
+    async def recv(self) -> memoryview:
+        """
+        Receive the next datagram. If no datagram from a previous batch is pending
+        then wait for the socket and read a new batch.
+
+        Returns:
+            A view of the payload of the datagram. The view is only valid until the
+            next batch is read, it has to be decoded or copied before awaiting `recv`
+            again
+        """
+        if not self._pending:
+            loop = aio.get_running_loop()
+            first_slot = self._slots[0]
+            n_bytes = await loop.sock_recv_into(self._sock, first_slot)
+            self._pending.append(first_slot[:n_bytes])
+            self._read_queued_datagrams()
+
+        return self._pending.popleft()
+
+    def _read_queued_datagrams(self) -> None:
+        for slot in self._slots[1:]:
+            try:
+                n_bytes = self._sock.recv_into(slot)
+            except BlockingIOError:
+                break
+            self._pending.append(slot[:n_bytes])
+
+    def close(self) -> None:
+        "Close the underlying socket"
+        self._sock.close()
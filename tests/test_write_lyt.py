@@ -0,0 +1,27 @@
+"""
+Tests for writing traces of cones as lyt blocks
+"""
+import numpy as np
+
+from lfsd.lyt_interface.io.common import BLOCK_DTYPE
+from lfsd.lyt_interface.io.write_lyt import _fill_lyt_trace_blocks
+
+
+def test_fill_lyt_trace_blocks_heading_of_wide_trace() -> None:
+    # the differences between these cones do not fit in int16
+    trace = np.array(
+        [[-30000, -20000], [30000, 0], [20000, 30000], [-25000, 25000]],
+        dtype=np.int16,
+    )
+    blocks = np.empty(len(trace), dtype=BLOCK_DTYPE)
+
+    _fill_lyt_trace_blocks(blocks, trace, color_idx=0)
+
+    trace_float = trace.astype(np.float64)
+    diffs = np.roll(trace_float, -1, axis=0) - trace_float
+    angles = np.arctan2(diffs[:, 1], diffs[:, 0])
+    expected_heading = (angles * 128 / np.pi + 128).astype(np.int32) % 256
+
+    np.testing.assert_array_equal(blocks["heading"], expected_heading)
+    np.testing.assert_array_equal(blocks["x"], trace[:, 0])
+    np.testing.assert_array_equal(blocks["y"], trace[:, 1])